@@ -1,48 +1,253 @@
-import json
+import importlib
 import os
 import shutil
-import tempfile
+import sys
 import uuid
 import zipfile
-from copy import deepcopy
+from collections import Counter
+from collections.abc import Iterable
 from io import BytesIO
+from itertools import tee
 from pathlib import Path
 
 import jinja2
-import requests
 from data import CONTEXT, DATA, IDS, KEY_MAPPING, OBJECT_MAPPING, PLATFORMS
-from flask import Flask, jsonify, render_template, request, send_file
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    render_template,
+    request,
+    send_file,
+    url_for,
+)
 from flask_cors import CORS
-from pyld import jsonld
-from rocrate.rocrate import ROCrate
 from werkzeug.utils import secure_filename
 
+BASE_DIR = Path(__file__).resolve().parent
+
+sys.path.append(str(BASE_DIR.parent))
+
+from shared import codec  # noqa: E402
+from shared.compression import ResponseCompressor  # noqa: E402
+from shared.crates import (  # noqa: E402
+    MANIFEST,
+    CrateCache,
+    CrateIndex,
+    CrateWriter,
+    build_crate,
+    find_entities,
+    find_entity,
+)
+from shared.fragments import FragmentCache  # noqa: E402
+from shared.ids import IdAllocator  # noqa: E402
+from shared.jobs import JobFailed, JobQueue  # noqa: E402
+from shared.loader import CachedDocumentLoader  # noqa: E402
+from shared.peers import PeerClient, PeerError  # noqa: E402
+from shared.store import content_hash, open_store  # noqa: E402
+from shared.translation import PLANS, translate  # noqa: E402
+from shared.uploads import HashingSpooledFile, SpooledRequest  # noqa: E402
+
 app = Flask(
     __name__,
     static_url_path="",
     static_folder="assets",
 )
 
+app.request_class = SpooledRequest
+app.json = codec.CodecJSONProvider(app)
+
 CORS(app)
 
 app.config["UPLOAD_FOLDER"] = "temp_uploads/"
 app.config["RO_CRATE_FOLDER"] = "ro_crates/"
-app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024
+app.config["MAX_CONTENT_LENGTH"] = 4 * 1024 * 1024 * 1024
+app.config["SPOOL_MEMORY_LIMIT"] = 1024 * 1024
 app.config["SHARED_PATH"] = "../shared"
+app.config["PERSIST_CRATES"] = True
+app.config["CRATE_CACHE_SIZE"] = 64
+app.config["CRATE_MANIFEST_CACHE_SIZE"] = 64
+app.config["CHANGE_HISTORY"] = 10000
+app.config["STORAGE_BACKEND"] = "memory"
+app.config["SQLITE_PATH"] = "data.sqlite3"
+app.config["ID_BLOCK_SIZE"] = 16
+app.config["CHANGE_KEEPALIVE"] = 15
+app.config["CONTEXT_CACHE_FOLDER"] = "contexts/"
+app.config["ALLOW_REMOTE_CONTEXTS"] = False
+app.config["EXPORT_WORKERS"] = 4
+app.config["COMPACT_CRATES"] = True
+app.config["COMPRESS_MIN_SIZE"] = 1024
+app.config["COMPRESS_ENCODINGS"] = ["zstd", "br", "gzip"]
+app.config["CRATE_COMPRESSION"] = {
+    "types": None,
+    "ontology": None,
+    "export": None,
+    "sync": None,
+}
+app.config["PEER_HOST"] = "localhost"
+app.config["PEER_CONNECT_TIMEOUT"] = 3.05
+app.config["PEER_READ_TIMEOUT"] = 60
+app.config["PEER_RETRIES"] = 3
+app.config["WARM_UP"] = None
+app.config["PRELOAD_DEPENDENCIES"] = False
 
-app.jinja_loader = jinja2.ChoiceLoader(
-    [
-        jinja2.FileSystemLoader("templates"),
-        jinja2.FileSystemLoader("../shared/templates"),
-    ]
+PATH_SETTINGS = (
+    "UPLOAD_FOLDER",
+    "RO_CRATE_FOLDER",
+    "SHARED_PATH",
+    "SQLITE_PATH",
+    "CONTEXT_CACHE_FOLDER",
 )
 
 PORT = 5002
 
-ORIGINAL_DATA = deepcopy(DATA)
-ORIGINAL_IDS = deepcopy(IDS)
-ORIGINAL_OBJECT_MAPPING = deepcopy(OBJECT_MAPPING)
-ORIGINAL_KEY_MAPPING = deepcopy(KEY_MAPPING)
+PARENT_KEY = "has_parent"
+CHILDREN_KEY = "has_children"
+IMPORTED_KEY = "was_imported"
+NDJSON = "application/x-ndjson"
+CONTEXTS_FILE = "contexts.json"
+IMPORT_MESSAGES = {
+    "created": "Data imported successfully.",
+    "updated": "Data updated successfully.",
+    "unchanged": "The item is already up to date.",
+}
+
+INITIAL_SNAPSHOT = "initial"
+LAZY_MODULES = ("rocrate.rocrate", "pyld.jsonld", "requests")
+
+PERSISTED_STATE = {
+    "object_mapping": OBJECT_MAPPING,
+    "key_mapping": KEY_MAPPING,
+    "context": CONTEXT,
+}
+
+# State key of the [epoch, sequence] last synced from each peer port.
+SYNC_WATERMARKS = "sync_watermarks"
+
+# Store version at which this process last read PERSISTED_STATE.
+STATE_VERSION = 0
+
+
+def create_app(config=None) -> Flask:
+    """Configure the app and start the services its routes share.
+
+    Settings are read from `FLASK_`-prefixed environment variables, then
+    from `config`. Relative paths are resolved against this platform's
+    folder. The services are module globals, so one app is created per
+    process; WSGI servers call this once in every worker.
+    """
+    global STORE, ID_ALLOCATOR, DOCUMENT_LOADER, CRATE_INDEX, CRATE_WRITER
+    global CRATE_CACHE, PEERS, EXPORT_JOBS, COMPRESSOR, FRAGMENTS, STATE_VERSION
+    if "interop" in app.extensions:
+        raise RuntimeError("The app was already created.")
+    app.config.from_prefixed_env()
+    app.config.update(config or {})
+    for key in PATH_SETTINGS:
+        app.config[key] = str((BASE_DIR / app.config[key]).resolve())
+
+    app.jinja_loader = jinja2.ChoiceLoader(
+        [
+            jinja2.FileSystemLoader(BASE_DIR / "templates"),
+            jinja2.FileSystemLoader(Path(app.config["SHARED_PATH"]) / "templates"),
+        ]
+    )
+
+    STORE = open_store(
+        app.config["STORAGE_BACKEND"],
+        app.config["SQLITE_PATH"],
+        DATA,
+        history=app.config["CHANGE_HISTORY"],
+        provenance_key=IMPORTED_KEY,
+        parent_key=PARENT_KEY,
+        children_key=CHILDREN_KEY,
+    )
+
+    ID_ALLOCATOR = IdAllocator(STORE, IDS, block_size=app.config["ID_BLOCK_SIZE"])
+
+    with STORE.batch():
+        for name, mapping in PERSISTED_STATE.items():
+            if (saved := STORE.get_state(name)) is not None:
+                mapping.clear()
+                mapping.update(saved)
+            else:
+                STORE.set_state(name, mapping)
+        if not any(
+            snapshot["name"] == INITIAL_SNAPSHOT for snapshot in STORE.snapshots()
+        ):
+            STORE.snapshot(INITIAL_SNAPSHOT)
+        STATE_VERSION = STORE.version
+
+    DOCUMENT_LOADER = CachedDocumentLoader(
+        cache_dir=app.config["CONTEXT_CACHE_FOLDER"],
+        allow_network=app.config["ALLOW_REMOTE_CONTEXTS"],
+    ).install()
+    DOCUMENT_LOADER.preload_contexts(CONTEXT)
+
+    CRATE_INDEX = CrateIndex(
+        app.config["RO_CRATE_FOLDER"],
+        maxsize=app.config["CRATE_MANIFEST_CACHE_SIZE"],
+    )
+
+    CRATE_WRITER = CrateWriter(
+        app.config["RO_CRATE_FOLDER"],
+        app.config["UPLOAD_FOLDER"],
+        enabled=app.config["PERSIST_CRATES"],
+        index=CRATE_INDEX,
+    )
+
+    CRATE_CACHE = CrateCache(maxsize=app.config["CRATE_CACHE_SIZE"])
+
+    PEERS = PeerClient(
+        PLATFORMS,
+        host=app.config["PEER_HOST"],
+        connect_timeout=app.config["PEER_CONNECT_TIMEOUT"],
+        read_timeout=app.config["PEER_READ_TIMEOUT"],
+        retries=app.config["PEER_RETRIES"],
+    )
+
+    EXPORT_JOBS = JobQueue(workers=app.config["EXPORT_WORKERS"], store=STORE)
+
+    app.before_request(_refresh_state)
+
+    COMPRESSOR = app.after_request(
+        ResponseCompressor(
+            min_size=app.config["COMPRESS_MIN_SIZE"],
+            encodings=app.config["COMPRESS_ENCODINGS"],
+        )
+    )
+
+    FRAGMENTS = FragmentCache(
+        STORE,
+        {
+            "full": lambda item: codec.dumps(_contextualize(item)),
+            "compact": lambda item: codec.dumps(_reference_context(item)),
+        },
+    )
+
+    app.extensions["interop"] = STORE
+    if (enabled := app.config["WARM_UP"]) is None:
+        enabled = app.config["STORAGE_BACKEND"] == "memory"
+    if enabled:
+        warm_up()
+    if app.config["PRELOAD_DEPENDENCIES"]:
+        preload()
+    return app
+
+
+def warm_up():
+    """Build the caches that the first requests would otherwise fill."""
+    CRATE_INDEX.refresh()
+    items = list(STORE)
+    for variant in ("full", "compact"):
+        FRAGMENTS.join(items, variant)
+    app.jinja_env.get_template("index.html")
+
+
+def preload():
+    """Import the dependencies otherwise loaded by the first request using them."""
+    for module in LAZY_MODULES:
+        importlib.import_module(module)
+    PEERS.connect()
 
 
 @app.route("/")
@@ -58,17 +263,44 @@ def serve_shared_content(filename):
 
 @app.route("/crates", methods=["GET"])
 def get_crates():
-    return jsonify(
-        [crate.name for crate in Path(app.config["RO_CRATE_FOLDER"]).iterdir()]
-    )
+    offset = request.args.get("offset", 0, type=int)
+    limit = request.args.get("limit", type=int)
+    if offset < 0 or (limit is not None and limit < 1):
+        return jsonify({"message": "Invalid offset or limit."}), 400
+    try:
+        crates = CRATE_INDEX.list(
+            request.args.get("sort", "name"), request.args.get("order") == "desc"
+        )
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    end = offset + limit if limit else None
+    response = jsonify(crates[offset:end])
+    response.headers["X-Total-Count"] = len(crates)
+    return response
 
 
 @app.route("/crate", methods=["GET"])
 def get_crate_content():
-    name = request.args.get("name")
-    path = Path(app.config["RO_CRATE_FOLDER"]) / name
-    crate = ROCrate(path)
-    return jsonify(crate.metadata.generate())
+    if (manifest := CRATE_INDEX.manifest(request.args.get("name", ""))) is None:
+        return jsonify({"message": "Crate not found."}), 404
+    return jsonify(manifest)
+
+
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    return jsonify(
+        {
+            "translation_plans": PLANS.stats(),
+            "document_loader": DOCUMENT_LOADER.stats(),
+            "crate_cache": CRATE_CACHE.stats(),
+            "crate_index": CRATE_INDEX.stats(),
+            "peers": PEERS.stats(),
+            "jobs": EXPORT_JOBS.stats(),
+            "fragments": FRAGMENTS.stats(),
+            "json_codec": codec.BACKEND,
+            "compression": COMPRESSOR.stats(),
+        }
+    )
 
 
 @app.route("/platforms", methods=["GET"])
@@ -78,162 +310,292 @@ def get_platforms():
 
 @app.route("/data", methods=["GET"])
 def get_data():
-    return jsonify([_contextualize(item) for item in DATA])
+    return _list_objects()
+
+
+@app.route("/data/changes", methods=["GET"])
+def get_changes():
+    since = request.args.get("since", 0, type=int)
+    changes, reset = STORE.changes.since(since)
+    return jsonify(
+        {
+            "sequence": changes[-1]["seq"] if changes else STORE.version,
+            "reset": reset,
+            "changes": [_describe_change(change) for change in changes],
+        }
+    )
+
+
+@app.route("/data/changes/stream", methods=["GET"])
+def stream_changes():
+    since = request.headers.get("Last-Event-ID") or request.args.get("since", "0")
+    if not since.isdigit():
+        return jsonify({"message": "Invalid event id."}), 400
+    since = int(since)
+    keepalive = app.config["CHANGE_KEEPALIVE"]
+
+    def events(since):
+        while True:
+            changes, reset = STORE.changes.wait(since, timeout=keepalive)
+            if reset:
+                since = STORE.version
+                yield f"id: {since}\nevent: reset\ndata: {{}}\n\n"
+            elif not changes:
+                yield ": keep-alive\n\n"
+            for change in changes:
+                since = change["seq"]
+                data = codec.dumps(_describe_change(change)).decode()
+                yield f"id: {since}\nevent: change\ndata: {data}\n\n"
+
+    return Response(
+        events(since),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/data/filter", methods=["GET"])
 def filter_data():
+    if not (filter_type := request.args.get("type")):
+        return "Type parameter is required for filtering.", 400
+    return _list_objects(object_type=filter_type)
+
+
+@app.route("/data/<object_id>/lineage", methods=["GET"])
+def get_lineage(object_id):
+    if object_id not in STORE:
+        return jsonify({"message": "The item was not found."}), 404
+    direction = request.args.get("direction", "descendants")
+    depth = request.args.get("depth", type=int)
+    if depth is not None and depth < 0:
+        return jsonify({"message": "Depth must not be negative."}), 400
+    try:
+        reached, links = STORE.lineage(object_id, direction, depth)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
     return jsonify(
-        [
-            _contextualize(item)
-            for item in DATA
-            if item["type"].lower() == filter_type.lower()
-        ]
-    ) if (
-        filter_type := request.args.get("type")
-    ) else "Type parameter is required for filtering.", 400
+        {
+            "id": object_id,
+            "direction": direction,
+            "depth": depth,
+            "objects": [
+                {"depth": distance, "object": _contextualize(STORE.get(reached_id))}
+                for reached_id, distance in reached
+            ],
+            "links": [list(link) for link in links],
+        }
+    )
 
 
 @app.route("/data/reset", methods=["GET"])
 def reset_data():
-    global DATA, IDS, OBJECT_MAPPING, KEY_MAPPING
-    DATA = deepcopy(ORIGINAL_DATA)
-    IDS = deepcopy(ORIGINAL_IDS)
-    OBJECT_MAPPING = deepcopy(ORIGINAL_OBJECT_MAPPING)
-    KEY_MAPPING = deepcopy(ORIGINAL_KEY_MAPPING)
-    for folder in ["RO_CRATE_FOLDER", "UPLOAD_FOLDER"]:
-        shutil.rmtree(app.config[folder])
-        Path(app.config[folder]).mkdir()
-    return jsonify({"message": "Data reset successfully."}), 200
+    name = request.args.get("snapshot", INITIAL_SNAPSHOT)
+    try:
+        with STORE.batch():
+            STORE.restore(name)
+            _load_state()
+            STORE.set_state(SYNC_WATERMARKS, {})
+    except KeyError as e:
+        return jsonify({"message": e.args[0]}), 404
+    CRATE_WRITER.clear()
+    return jsonify({"message": "Data reset successfully.", "snapshot": name}), 200
+
+
+@app.route("/snapshots", methods=["GET"])
+def list_snapshots():
+    return jsonify(STORE.snapshots())
+
+
+@app.route("/snapshots/<name>", methods=["POST"])
+def create_snapshot(name):
+    try:
+        with STORE.batch():
+            _save_state()
+            STORE.snapshot(name)
+    except KeyError as e:
+        return jsonify({"message": e.args[0]}), 409
+    return jsonify({"message": "Snapshot created successfully.", "name": name}), 201
+
+
+@app.route("/snapshots/<name>", methods=["DELETE"])
+def delete_snapshot(name):
+    try:
+        STORE.drop_snapshot(name)
+    except KeyError as e:
+        return jsonify({"message": e.args[0]}), 404
+    return jsonify({"message": "Snapshot deleted successfully.", "name": name}), 200
 
 
 @app.route("/data/types", methods=["GET"])
 def get_types():
-    types = list(OBJECT_MAPPING.keys())
-    temp_dir = Path(app.config["RO_CRATE_FOLDER"])
-    crate = ROCrate()
-    content = json.dumps(types, indent=4)
-    file = BytesIO(content.encode())
     filename = "ontologies"
-    crate.add_file(
-        file,
-        f"./{filename}.json",
-        properties={
-            "@type": "RESPONSE",
-        },
-    )
-    crate_dir = temp_dir / filename
-    temp_dir = Path(app.config["UPLOAD_FOLDER"])
-    crate.write_zip(crate_dir)
-    crate.write(temp_dir)
-    zipped_crate_path = crate_dir.with_suffix(".zip")
-    return send_file(
-        zipped_crate_path,
-        as_attachment=True,
-        download_name=zipped_crate_path.name,
-    )
+    key = ("types", None, STORE.version)
+    if not (entry := CRATE_CACHE.get(key)):
+        types = list(OBJECT_MAPPING.keys())
+        content = codec.dumps(types)
+        crate = build_crate(
+            {f"{filename}.json": content},
+            "RESPONSE",
+            compresslevel=app.config["CRATE_COMPRESSION"]["types"],
+        )
+        CRATE_WRITER.submit(filename, crate)
+        entry = CRATE_CACHE.put(key, crate)
+    return _send_crate(*entry, filename)
 
 
 @app.route("/data/ontology", methods=["GET"])
 def get_objects_by_ontological_type():
     if not (ontology := request.args.get("type")):
         return "Missing ontological type.", 400
-    objects = [
-        _contextualize(item)
-        for item in DATA
-        if item["ontology"].lower() == ontology.lower()
-    ]
-    temp_dir = Path(app.config["RO_CRATE_FOLDER"])
-    crate = ROCrate()
-    content = json.dumps(objects, indent=4)
-    file = BytesIO(content.encode())
     filename = "objects"
-    crate.add_file(
-        file,
-        f"./{filename}.json",
-        properties={
-            "@type": "RESPONSE",
-        },
-    )
-    crate_dir = temp_dir / filename
-    temp_dir = Path(app.config["UPLOAD_FOLDER"])
-    crate.write_zip(crate_dir)
-    crate.write(temp_dir)
-    zipped_crate_path = crate_dir.with_suffix(".zip")
-    return send_file(
-        zipped_crate_path,
-        as_attachment=True,
-        download_name=zipped_crate_path.name,
-    )
+    compact = _compact_requested()
+    key = ("ontology", ontology.lower(), compact, STORE.version)
+    if not (entry := CRATE_CACHE.get(key)):
+        items = STORE.filter_by_ontology(ontology)
+        if compact:
+            content = _compact(items)
+        else:
+            content = FRAGMENTS.join(items, "full")
+        crate = build_crate(
+            {f"{filename}.json": content},
+            "RESPONSE",
+            compresslevel=app.config["CRATE_COMPRESSION"]["ontology"],
+        )
+        CRATE_WRITER.submit(filename, crate)
+        entry = CRATE_CACHE.put(key, crate)
+    return _send_crate(*entry, filename)
 
 
 @app.route("/data/import", methods=["POST"])
 def import_data():
-    port = request.args.get("port")
-    data = request.json
-    if any(item["title"] == data["title"] for item in DATA):
-        return jsonify({"message": "The item already exists."}), 409
-    try:
-        object_type, metadata = _transform_against_context(data)
-        metadata["was_imported"] = {  # type: ignore
-            "from": int(port),
-            "with_id": data["id"],
-        }
-        object_id = IDS[object_type]
-        object_id["counter"] += 1
-        data = {
-            "id": f"{object_id['prefix']}-{object_id['counter']}",
-            "type": object_type,
-            "title": data["title"],
-            "metadata": metadata,
-            "ontology": data["ontology"],
-        }
-        DATA.append(data)
-        return jsonify({"message": "Data imported successfully."}), 200
-    except Exception as e:
-        return jsonify({"message": str(e)}), 500
+    result = _receive_object(request.get_json(silent=True), request.args.get("port"))
+    if result["status"] >= 400:
+        return jsonify(result), result["status"]
+    return jsonify({"message": IMPORT_MESSAGES[result["outcome"]], **result}), result[
+        "status"
+    ]
 
 
 @app.route("/data/export", methods=["POST"])
 def export_data():
-    port = request.args.get("port")
-    object_id = request.json
-    sample = next(
-        (_contextualize(item) for item in DATA if item["id"] == object_id),
-        None,
-    )
-    temp_dir = Path(app.config["RO_CRATE_FOLDER"])
-    temp_dir.mkdir(exist_ok=True)
-    crate = ROCrate()
-    content = json.dumps(sample, indent=4)
-    file = BytesIO(content.encode())
-    filename = str(object_id).lower()
-    crate.add_file(
-        file,
-        f"./{filename}.json",
-        properties={
-            "@type": "EXPORT",
-        },
+    if (port := _peer_port()) is None:
+        return jsonify({"message": "Missing or unknown platform port."}), 400
+    try:
+        objects = _select_objects(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    except KeyError as e:
+        return jsonify({"message": f"Unknown objects: {e.args[0]}"}), 404
+    if not objects:
+        return jsonify({"message": "No objects to export."}), 400
+    job = EXPORT_JOBS.submit("export", _deliver_export, objects, port)
+    return jsonify(
+        {
+            "message": "Export queued.",
+            "job": job["id"],
+            "status": url_for("get_job", job_id=job["id"]),
+        }
+    ), 202
+
+
+@app.route("/data/sync", methods=["GET"])
+def get_sync_changes():
+    since = request.args.get("since", 0, type=int)
+    ontologies = request.args.getlist("ontology")
+    peer = request.args.get("peer", type=int)
+    changes, reset = STORE.changes.since(since)
+    if reset or request.args.get("epoch") != STORE.changes.epoch:
+        objects = [
+            item
+            for ontology in ontologies
+            for item in STORE.filter_by_ontology(ontology)
+        ]
+        sequence = STORE.version
+    else:
+        ids = dict.fromkeys(
+            change["id"]
+            for change in changes
+            if change["id"] and (peer is None or change["source"] != peer)
+        )
+        objects = [
+            item
+            for object_id in ids
+            if (item := STORE.get(object_id))
+            and any(STORE.matches(item, ontology=ontology) for ontology in ontologies)
+        ]
+        sequence = changes[-1]["seq"] if changes else since
+    headers = {"X-Data-Sequence": sequence, "X-Data-Epoch": STORE.changes.epoch}
+    if not objects:
+        return "", 204, headers
+    crate = _export_crate(objects, "sync")
+    return (
+        send_file(
+            BytesIO(crate),
+            mimetype="application/zip",
+            as_attachment=True,
+            download_name="sync.zip",
+        ),
+        200,
+        headers,
     )
-    crate_dir = temp_dir / filename
-    temp_dir = Path(app.config["UPLOAD_FOLDER"])
-    crate.write_zip(crate_dir)
-    crate.write(temp_dir)
-    with crate_dir.with_suffix(".zip").open("rb") as file:
-        filename = crate_dir.with_suffix(".zip").name
-        response = requests.post(
-            f"http://localhost:{port}/receive_zip?port={PORT}",
-            files={"file": (filename, file, "application/zip")},
+
+
+@app.route("/data/sync", methods=["POST"])
+def sync_data():
+    if (port := _peer_port()) is None:
+        return jsonify({"message": "Missing or unknown platform port."}), 400
+    epoch, since = STORE.get_state(SYNC_WATERMARKS, {}).get(str(port), (None, 0))
+    try:
+        response = PEERS.get(
+            port,
+            "/data/sync",
+            params={
+                "since": since,
+                "epoch": epoch,
+                "peer": PORT,
+                "ontology": list(OBJECT_MAPPING),
+            },
+            stream=True,
         )
-    if response.status_code == 200:
-        return jsonify(
-            {
-                "message": "Data sent to openBIS successfully",
-                "responseFromOpenBIS": response.json(),
-            }
-        ), 200
-    else:
-        return jsonify({"message": "Failed to send data to openBIS"}), 500
+    except PeerError:
+        return jsonify({"message": "Failed to reach the platform."}), 502
+    with response, HashingSpooledFile(app.config["SPOOL_MEMORY_LIMIT"]) as spool:
+        if response.status_code not in (200, 204):
+            return jsonify({"message": "Failed to fetch changes."}), 502
+        results = []
+        sequence = int(response.headers["X-Data-Sequence"])
+        if response.status_code == 200:
+            for chunk in response.iter_content(64 * 1024):
+                spool.write(chunk)
+        try:
+            # Advance the watermark in the batch applying the changes.
+            with STORE.batch():
+                if response.status_code == 200:
+                    with zipfile.ZipFile(spool, "r") as zip_file:
+                        results = _receive_crate(zip_file, port)
+                watermarks = STORE.get_state(SYNC_WATERMARKS, {})
+                watermark = [response.headers["X-Data-Epoch"], sequence]
+                STORE.set_state(SYNC_WATERMARKS, {**watermarks, str(port): watermark})
+        except zipfile.BadZipFile:
+            return jsonify({"message": "The platform sent an invalid zip file."}), 502
+        except ValueError as e:
+            return jsonify({"message": f"The platform sent an invalid crate: {e}"}), 502
+    return jsonify(
+        {
+            "message": "Data synchronized successfully.",
+            "since": since,
+            "sequence": sequence,
+            "summary": _summarize(results),
+            "results": results,
+        }
+    ), 200
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    if not (job := EXPORT_JOBS.get(job_id)):
+        return jsonify({"message": "Unknown job."}), 404
+    return jsonify(job)
 
 
 @app.route("/receive_zip", methods=["POST"])
@@ -244,46 +606,32 @@ def receive_zip():
         return jsonify({"message": "No selected file"}), 400
     if file.filename.endswith(".zip"):
         try:
-            byte_stream = BytesIO(file.read())
-            zip_file = zipfile.ZipFile(byte_stream, "r")
-            if "ro-crate-metadata.json" not in zip_file.namelist():
+            zip_file = zipfile.ZipFile(file.stream, "r")
+            if MANIFEST not in zip_file.namelist():
                 return jsonify({"message": "Missing crate manifest"}), 400
-            if not (filename := _get_export_filename_from_crate(zip_file)):
+            if not (results := _receive_crate(zip_file, request.args.get("port"))):
                 return jsonify({"message": "Missing export file"}), 400
-            with zip_file.open(filename) as export_file:
-                data: dict = json.load(export_file)
-            object_type, metadata = _transform_against_context(data)
-            if metadata.get("wasImported", {}).get("from") == PORT:
-                local_id = metadata["wasImported"]["with_id"]  # type: ignore
-                local_object: dict = next(
-                    filter(lambda item: item["id"] == local_id, DATA),
-                    None,
-                )
-                if not local_object:
-                    return jsonify(
-                        {"message": "The item was not found in the local database."}
-                    ), 404
-                metadata.pop("wasImported")
-                local_object["metadata"].update(metadata)
-            else:
-                port = request.args.get("port")
-                metadata["was_imported"] = {  # type: ignore
-                    "from": int(port),
-                    "with_id": data["id"],
-                }
-                object_id = IDS[object_type]
-                object_id["counter"] += 1
-                new_data = {
-                    "id": f"{object_id['prefix']}-{object_id['counter']}",
-                    "type": object_type,
-                    "title": data["title"],
-                    "metadata": metadata,
-                    "ontology": data["ontology"],
+            if not any(result["status"] < 400 for result in results):
+                return jsonify(
+                    {
+                        "message": results[0]["message"],
+                        "summary": _summarize(results),
+                        "results": results,
+                    }
+                ), results[0]["status"]
+            return jsonify(
+                {
+                    "message": "Zip file processed successfully",
+                    "size": file.stream.size,
+                    "sha256": file.stream.hexdigest(),
+                    "summary": _summarize(results),
+                    "results": results,
                 }
-                DATA.append(new_data)
-            return jsonify({"message": "Zip file processed successfully"}), 200
+            ), 200
         except zipfile.BadZipFile:
             return jsonify({"message": "Invalid zip file"}), 400
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
     else:
         return jsonify({"message": "Unsupported file type"}), 400
 
@@ -292,24 +640,19 @@ def receive_zip():
 def get_file(filename):
     path = Path(app.config["UPLOAD_FOLDER"]) / f"{filename}.json"
     with open(path, "r") as file:
-        return jsonify(json.load(file))
+        return jsonify(codec.load(file))
 
 
 @app.route("/data/run_simulation", methods=["GET"])
 def run_simulation():
     try:
         selected_object_id = request.args.get("id")
-        selected_object = next(
-            (item for item in DATA if item["id"] == selected_object_id),
-            None,
-        )
+        selected_object = STORE.get(selected_object_id)
         if selected_object is None:
             return jsonify({"message": "Selected object not found"}), 404
         object_type = "@aiida.Simulation"
-        object_id = IDS[object_type]
-        object_id["counter"] += 1
         new_simulation = {
-            "id": f"{object_id['prefix']}-{object_id['counter']}",
+            "id": ID_ALLOCATOR.next_id(object_type),
             "type": object_type,
             "title": f"New Simulation on {selected_object_id}",
             "metadata": {
@@ -320,15 +663,13 @@ def run_simulation():
                     "include_comments": True,
                 },
                 "aiida_version": "2.4.3",
-                "has_parent": selected_object_id,
+                PARENT_KEY: selected_object_id,
             },
             "ontology": "https://aiida.net/Simulation",
         }
-        if "has_children" not in selected_object["metadata"]:
-            selected_object["metadata"]["has_children"] = []
-        simulations: list = selected_object["metadata"]["has_children"]
-        simulations.append(new_simulation["id"])
-        DATA.append(new_simulation)
+        with STORE.batch():
+            STORE.add(new_simulation)
+            STORE.add_child(selected_object_id, new_simulation["id"])
         return jsonify(selected_object["id"]), 201
     except Exception as e:
         return jsonify({"message": str(e)}), 500
@@ -338,6 +679,41 @@ def _contextualize(item):
     return {**CONTEXT.get(item["ontology"], {}), **item}
 
 
+def _reference_context(item):
+    if "@context" in CONTEXT.get(item["ontology"], {}):
+        return {"@context": item["ontology"], **item}
+    return item
+
+
+def _contexts_of(items: list[dict]) -> dict[str, dict]:
+    ontologies = dict.fromkeys(item["ontology"] for item in items)
+    return {
+        ontology: CONTEXT[ontology]["@context"]
+        for ontology in ontologies
+        if "@context" in CONTEXT.get(ontology, {})
+    }
+
+
+def _compact(items: list[dict]) -> bytes:
+    contexts = codec.dumps(_contexts_of(items))
+    objects = FRAGMENTS.join(items, "compact")
+    return b'{"@contexts":' + contexts + b',"objects":' + objects + b"}"
+
+
+def _compact_requested() -> bool:
+    return request.args.get("compact", "false").lower() in ("1", "true")
+
+
+def _resolve_context(data: dict, contexts: dict[str, dict]) -> dict:
+    """Inline a context referenced by IRI from the package's `contexts`.
+
+    Other references are left to the document loader.
+    """
+    if isinstance(reference := data.get("@context"), str) and reference in contexts:
+        return {**data, "@context": contexts[reference]}
+    return data
+
+
 def _transform_against_context(data):
     ontology = data["ontology"]
     if context := CONTEXT.get(ontology, {}):
@@ -357,33 +733,283 @@ def _transform_against_context(data):
                 KEY_MAPPING[iri] = field
             new_context[field] = properties
         CONTEXT[ontology] = {"@context": new_context}
+        DOCUMENT_LOADER.preload(ontology, CONTEXT[ontology])
+        FRAGMENTS.invalidate_ontology(ontology)
+        _save_state()
         metadata = _translate(data, new_context)
     return object_type, metadata
 
 
 def _translate(data, ctx):
-    expanded = jsonld.expand(
-        {
-            "@context": data["@context"],
-            **data["metadata"],
-        },
+    return translate(data["@context"], data["metadata"], ctx)
+
+
+def _send_crate(crate: bytes, etag: str, name: str):
+    return send_file(
+        BytesIO(crate),
+        mimetype="application/zip",
+        as_attachment=True,
+        download_name=f"{name}.zip",
+        etag=etag,
+        conditional=True,
     )
-    metadata = jsonld.compact(expanded, ctx)
-    metadata.pop("@context")
-    return metadata
-
-
-def _get_export_filename_from_crate(zip_file: zipfile.ZipFile):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        zip_file.extractall(temp_dir)
-        return next(
-            (
-                entity.id
-                for entity in ROCrate(temp_dir).data_entities
-                if entity.type == "EXPORT"
-            ),
-            None,
+
+
+def _deliver_export(objects: list[dict], port) -> dict:
+    filename = objects[0]["id"].lower() if len(objects) == 1 else "export"
+    crate = _export_crate(objects)
+    CRATE_WRITER.submit(filename, crate)
+    try:
+        response = PEERS.post(
+            port,
+            f"/receive_zip?port={PORT}",
+            files={"file": (f"{filename}.zip", BytesIO(crate), "application/zip")},
+        )
+    except PeerError as e:
+        raise JobFailed("Failed to send data to openBIS") from e
+    if response.status_code != 200:
+        raise JobFailed(
+            "Failed to send data to openBIS",
+            {"status": response.status_code, "responseFromOpenBIS": response.text},
+        )
+    return {
+        "message": "Data sent to openBIS successfully",
+        "responseFromOpenBIS": response.json(),
+    }
+
+
+def _list_objects(object_type=None):
+    sequence = STORE.version
+    limit = request.args.get("limit", type=int)
+    stream = request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON
+    try:
+        if stream and limit is None:
+            items, cursor = STORE.scan(request.args.get("cursor"), object_type), None
+        else:
+            items, cursor = STORE.page(request.args.get("cursor"), limit, object_type)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    if stream:
+        response = Response(_ndjson(items, _compact_requested()), mimetype=NDJSON)
+    elif _compact_requested():
+        response = Response(_compact(items), mimetype="application/json")
+    else:
+        response = Response(FRAGMENTS.join(items, "full"), mimetype="application/json")
+    response.headers["X-Data-Sequence"] = sequence
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+        next_url = url_for(
+            request.endpoint, **{**request.args.to_dict(), "cursor": cursor}
         )
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response
+
+
+def _ndjson(items: Iterable[dict], compact=False):
+    if not compact:
+        for fragment in FRAGMENTS.fragments(items, "full"):
+            yield fragment + b"\n"
+        return
+    emitted = set()
+    items, rendered = tee(items)
+    for item, fragment in zip(items, FRAGMENTS.fragments(rendered, "compact")):
+        if (contexts := _contexts_of([item])) and item["ontology"] not in emitted:
+            emitted.add(item["ontology"])
+            yield codec.dumps({"@contexts": contexts}) + b"\n"
+        yield fragment + b"\n"
+
+
+def _load_state():
+    _read_state()
+    ID_ALLOCATOR.reset(STORE.get_state(ID_ALLOCATOR.state_key, IDS))
+    _save_state()
+
+
+def _refresh_state():
+    """Reread the learned state if another process saved or reset it."""
+    global STATE_VERSION
+    if (version := STORE.version) == STATE_VERSION:
+        return
+    changes, reset = STORE.changes.since(STATE_VERSION)
+    if reset or any(change["op"] == "state" for change in changes):
+        _read_state()
+    STATE_VERSION = version
+
+
+def _read_state():
+    for name, mapping in PERSISTED_STATE.items():
+        saved = STORE.get_state(name, {})
+        if mapping is CONTEXT:
+            for ontology in mapping.keys() | saved.keys():
+                if mapping.get(ontology) != saved.get(ontology):
+                    FRAGMENTS.invalidate_ontology(ontology)
+                    if ontology in saved:
+                        DOCUMENT_LOADER.preload(ontology, saved[ontology])
+        for key in mapping.keys() - saved.keys():
+            del mapping[key]
+        mapping.update(saved)
+
+
+def _save_state():
+    """Merge the learned state into the store's, key by key.
+
+    Keys learned by other processes are kept and read back. A "state" change
+    tells them to reread it.
+    """
+    with STORE.batch():
+        changed = False
+        for name, mapping in PERSISTED_STATE.items():
+            saved = STORE.get_state(name, {})
+            merged = {**saved, **mapping}
+            mapping.update(merged)
+            if merged != saved:
+                STORE.set_state(name, merged)
+                changed = True
+        if changed:
+            STORE.changes.append("state")
+            STORE.on_rollback(_read_state)
+
+
+def _describe_change(change: dict) -> dict:
+    item = STORE.get(change["id"]) if change["id"] else None
+    return {**change, "item": _contextualize(item) if item else None}
+
+
+def _export_crate(objects: list[dict], endpoint="export") -> bytes:
+    compresslevel = app.config["CRATE_COMPRESSION"][endpoint]
+    variant = "compact" if app.config["COMPACT_CRATES"] else "full"
+    files = {
+        f"{item['id'].lower()}.json": fragment
+        for item, fragment in zip(objects, FRAGMENTS.fragments(objects, variant))
+    }
+    if variant == "full":
+        return build_crate(files, "EXPORT", compresslevel=compresslevel)
+    files[CONTEXTS_FILE] = codec.dumps(_contexts_of(objects))
+    return build_crate(files, "EXPORT", {CONTEXTS_FILE: "CONTEXT"}, compresslevel)
+
+
+def _receive_crate(zip_file: zipfile.ZipFile, port) -> list[dict]:
+    contexts = {}
+    if filename := find_entity(zip_file, "CONTEXT"):
+        with zip_file.open(filename) as contexts_file:
+            contexts = codec.load(contexts_file)
+    results = []
+    with STORE.batch():
+        for filename in find_entities(zip_file, "EXPORT"):
+            with zip_file.open(filename) as export_file:
+                data: dict = codec.load(export_file)
+            results.append(_receive_object(data, port, contexts))
+    return results
+
+
+def _peer_port() -> int | None:
+    port = request.args.get("port", type=int)
+    return port if port in PLATFORMS.values() else None
+
+
+def _select_objects(selection) -> list[dict]:
+    if isinstance(selection, str):
+        selection = {"ids": [selection]}
+    elif isinstance(selection, list):
+        selection = {"ids": selection}
+    if not isinstance(selection, dict):
+        raise ValueError("Invalid selection.")
+    ids = selection.get("ids")
+    depth = selection.get("depth")
+    if not (
+        ids is None or (isinstance(ids, list) and all(isinstance(i, str) for i in ids))
+    ) or not (depth is None or (isinstance(depth, int) and depth >= 0)):
+        raise ValueError("Invalid selection.")
+    if ids:
+        if missing := [object_id for object_id in ids if object_id not in STORE]:
+            raise KeyError(missing)
+        return [STORE.get(object_id) for object_id in dict.fromkeys(ids)]
+    object_type, ontology = selection.get("type"), selection.get("ontology")
+    if root := selection.get("root"):
+        if root not in STORE:
+            raise KeyError([root])
+        reached, _ = STORE.lineage(root, depth=selection.get("depth"))
+        return [
+            item
+            for object_id, _ in reached
+            if STORE.matches(item := STORE.get(object_id), object_type, ontology)
+        ]
+    if not (object_type or ontology):
+        return []
+    return STORE.filter(object_type, ontology)
+
+
+def _summarize(results: list[dict]) -> dict[str, int]:
+    return dict(Counter(result["outcome"] for result in results))
+
+
+def _receive_object(data: dict, port, contexts=None) -> dict:
+    if not isinstance(data, dict):
+        return {
+            "id": None,
+            "status": 400,
+            "outcome": "failed",
+            "message": "The item must be a JSON object.",
+        }
+    try:
+        port = None if port is None else int(port)
+        data = _resolve_context(data, contexts or {})
+        with STORE.batch():
+            # Learn a new ontology under the write lock, from the latest state,
+            # so concurrent imports of it agree on its mappings.
+            _refresh_state()
+            object_type, metadata = _transform_against_context(data)
+            origin = metadata.pop(IMPORTED_KEY, None) or {}
+            digest = content_hash(metadata)
+            if origin.get("from") == PORT:
+                local_id = origin["with_id"]
+                if local_id not in STORE:
+                    return {
+                        "id": data["id"],
+                        "status": 404,
+                        "outcome": "failed",
+                        "message": "The item was not found in the local database.",
+                    }
+            elif local_object := STORE.find_imported(port, data["id"]):
+                local_id = local_object["id"]
+            else:
+                metadata[IMPORTED_KEY] = {  # type: ignore
+                    "from": port,
+                    "with_id": data["id"],
+                }
+                new_data = {
+                    "id": ID_ALLOCATOR.next_id(object_type),
+                    "type": object_type,
+                    "title": data["title"],
+                    "metadata": metadata,
+                    "ontology": data["ontology"],
+                }
+                STORE.add(new_data, source=port)
+                STORE.mark_received(port, data["id"], digest)
+                return {
+                    "id": data["id"],
+                    "status": 201,
+                    "local_id": new_data["id"],
+                    "outcome": "created",
+                }
+            outcome = "unchanged"
+            if STORE.received_hash(port, data["id"]) != digest:
+                if STORE.update_metadata(local_id, metadata, source=port):
+                    outcome = "updated"
+                STORE.mark_received(port, data["id"], digest)
+        return {
+            "id": data["id"],
+            "status": 200,
+            "local_id": local_id,
+            "outcome": outcome,
+        }
+    except Exception as e:
+        return {
+            "id": data.get("id"),
+            "status": 500,
+            "outcome": "failed",
+            "message": str(e),
+        }
 
 
 @app.route("/download")
@@ -431,20 +1057,13 @@ def upload_rocrate():
 
 
 def extract_and_read_rocrate(file_path):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Unzip the file
-        with zipfile.ZipFile(file_path, "r") as zip_ref:
-            zip_ref.extractall(temp_dir)
-
-        # Process the unzipped directory
-        crate = ROCrate(temp_dir)
-        for entity in crate.get_entities():
-            print(entity)
-            if entity["@type"] == "RESPONSE":
-                response_file_path = os.path.join(temp_dir, entity["@id"])
-                with open(response_file_path, "r") as file:
-                    return json.load(file)
-        return None
+    with zipfile.ZipFile(file_path, "r") as zip_ref:
+        if MANIFEST not in zip_ref.namelist():
+            return None
+        if not (filename := find_entity(zip_ref, "RESPONSE")):
+            return None
+        with zip_ref.open(filename) as file:
+            return codec.load(file)
 
 
 @app.route("/files", methods=["GET"])
@@ -487,4 +1106,4 @@ def upload_file():
 
 
 if __name__ == "__main__":
-    app.run(port=PORT, debug=True)
+    create_app().run(port=PORT, debug=True, threaded=True)
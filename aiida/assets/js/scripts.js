@@ -4,25 +4,15 @@ document.getElementById("sampleSelect").addEventListener("change", () => {
   button.disabled = !select.value;
 });
 
-function fetchData() {
-  fetch("/data")
-    .then((response) => response.json())
-    .then((data) => {
-      updateTable(data);
-      populateTypes(data);
-      populateExportSamples(data);
-      populateSelectSimulation(data);
-    })
-    .catch((error) => {
-      console.error("Error:", error);
-      handleError("Failed to fetch data.");
-    });
+function populateSelections(data) {
+  populateExportSamples(data);
+  populateSelectSimulation(data);
 }
 
 function populateSelectSimulation(data) {
   const samplesList = data.filter((item) => item.type.includes("Sample"));
   const select = document.getElementById("sampleSelect");
-  select.nextElementSibling.disabled = true;
+  const selected = select.value;
   select.innerHTML = "";
   const option = document.createElement("option");
   option.value = "";
@@ -34,6 +24,7 @@ function populateSelectSimulation(data) {
     option.textContent = item.id + " - " + item.title;
     select.appendChild(option);
   });
+  restoreSelection(select, selected);
 }
 
 function runSimulation() {
@@ -57,9 +48,6 @@ function runSimulation() {
         throw new Error("Failed to start simulation.");
       }
     })
-    .then((response) => {
-      fetchData();
-    })
     .catch((error) => {
       console.log(error);
       handleError("Failed to fetch or process data.");
@@ -0,0 +1,65 @@
+"""Compare JSON encoding of contextualized objects across codecs.
+
+Usage: python benchmarks/json_codec.py [objects] [rounds]
+"""
+
+import json
+import sys
+import time
+from copy import deepcopy
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "aiida"))
+
+from data import CONTEXT, DATA  # noqa: E402
+
+from shared import codec  # noqa: E402
+
+
+def make_objects(count: int) -> list[dict]:
+    objects = []
+    for index in range(count):
+        item = deepcopy(DATA[index % len(DATA)])
+        item["id"] = f"{item['id']}-{index}"
+        objects.append({**CONTEXT.get(item["ontology"], {}), **item})
+    return objects
+
+
+def measure(encode, decode, objects, rounds):
+    encoded = encode(objects)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encode(objects)
+    encode_time = (time.perf_counter() - start) / rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        decode(encoded)
+    decode_time = (time.perf_counter() - start) / rounds
+    return len(encoded), encode_time, decode_time
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    objects = make_objects(count)
+    codecs = {
+        "json, indent=4": (lambda obj: json.dumps(obj, indent=4).encode(), json.loads),
+        "json, compact": (
+            lambda obj: json.dumps(obj, separators=(",", ":")).encode(),
+            json.loads,
+        ),
+        f"codec ({codec.BACKEND})": (codec.dumps, codec.loads),
+    }
+    print(f"{count} objects, {rounds} rounds")
+    print(f"{'codec':<20} {'bytes':>12} {'encode ms':>10} {'decode ms':>10}")
+    for name, (encode, decode) in codecs.items():
+        size, encode_time, decode_time = measure(encode, decode, objects, rounds)
+        print(
+            f"{name:<20} {size:>12} {encode_time * 1000:>10.1f} {decode_time * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Measure the cold start of the platform apps with `python -X importtime`.
+
+Each round starts a fresh interpreter that imports a platform's `app` and
+calls `create_app`, with and without `PRELOAD_DEPENDENCIES`. Reports the
+median import and app creation times, and the slowest imports of `app`.
+
+Usage: python benchmarks/startup.py [platform] [rounds]
+"""
+
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+SCRIPT = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app({{"PRELOAD_DEPENDENCIES": {preload}, "WARM_UP": True}})
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def run(platform: str, preload: bool) -> tuple[float, float, dict[str, int]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT.format(preload=preload)],
+        cwd=ROOT / platform,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    import_time, create_time = map(float, result.stdout.split()[-2:])
+    return import_time, create_time, parse_importtime(result.stderr)
+
+
+def parse_importtime(output: str, module="app") -> dict[str, int]:
+    """Cumulative microseconds of each import made directly by `module`."""
+    children = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative)
+        elif depth == 0:
+            if name.strip() == module:
+                return children
+            children = {}
+    return {}
+
+
+def main():
+    platform = sys.argv[1] if len(sys.argv) > 1 else "aiida"
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(f"{platform}, {rounds} rounds")
+    print(f"{'mode':<10} {'import ms':>10} {'create_app ms':>14} {'total ms':>10}")
+    slowest = {}
+    for preload in (False, True):
+        runs = [run(platform, preload) for _ in range(rounds)]
+        import_time = statistics.median(run[0] for run in runs) * 1000
+        create_time = statistics.median(run[1] for run in runs) * 1000
+        mode = "preload" if preload else "lazy"
+        print(
+            f"{mode:<10} {import_time:>10.1f} {create_time:>14.1f}"
+            f" {import_time + create_time:>10.1f}"
+        )
+        if not preload:
+            slowest = runs[-1][2]
+    print("\nslowest imports of app (lazy):")
+    for name, cumulative in sorted(slowest.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {name:<30} {cumulative / 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Serve a platform under gunicorn with several worker processes and threads.
+
+Usage: python serve.py {aiida,openbis} [--workers N] [--threads M] [--backend B]
+
+Every worker builds its own app with `create_app` before accepting requests.
+Workers only share data through the `sqlite` backend, so it is the default.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+from pathlib import Path
+
+from gunicorn.app.base import BaseApplication
+
+ROOT = Path(__file__).resolve().parent
+PLATFORMS = ("aiida", "openbis")
+
+
+class PlatformApplication(BaseApplication):
+    def __init__(self, module, options: dict, config: dict):
+        self.module = module
+        self.options = options
+        self.app_config = config
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.module.create_app(self.app_config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("platform", choices=PLATFORMS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, help="defaults to the platform's port")
+    parser.add_argument(
+        "--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", "2"))
+    )
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--timeout", type=int, default=120)
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="sqlite")
+    args = parser.parse_args()
+    if args.workers > 1 and args.backend == "memory":
+        parser.error("several workers need the sqlite backend to share data")
+
+    sys.path.insert(0, str(ROOT / args.platform))
+    module = importlib.import_module("app")
+    options = {
+        "bind": f"{args.host}:{args.port or module.PORT}",
+        "workers": args.workers,
+        "threads": args.threads,
+        "timeout": args.timeout,
+        "preload_app": False,
+    }
+    PlatformApplication(module, options, {"STORAGE_BACKEND": args.backend}).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,8 @@
+let dataSequence = 0;
+const dataItems = new Map();
+let changeStream = null;
+let showDataPending = false;
+
 document.addEventListener("DOMContentLoaded", () => {
   fetchData();
   fetchCrates();
@@ -38,8 +43,70 @@ document.getElementById("exportSelect").addEventListener("change", () => {
   button.disabled = !select.value;
 });
 
+function fetchData() {
+  fetch("/data")
+    .then((response) => {
+      dataSequence = Number(response.headers.get("X-Data-Sequence")) || 0;
+      return response.json();
+    })
+    .then((data) => {
+      dataItems.clear();
+      data.forEach((item) => dataItems.set(item.id, item));
+      showData();
+      subscribeToChanges();
+    })
+    .catch((error) => {
+      console.error("Error:", error);
+      handleError("Failed to fetch data.");
+    });
+}
+
+function subscribeToChanges() {
+  if (changeStream) {
+    return;
+  }
+  changeStream = new EventSource(`/data/changes/stream?since=${dataSequence}`);
+  changeStream.addEventListener("change", (event) => {
+    const change = JSON.parse(event.data);
+    dataSequence = change.seq;
+    if (change.item) {
+      dataItems.set(change.item.id, change.item);
+    }
+    scheduleShowData();
+  });
+  changeStream.addEventListener("reset", () => fetchData());
+}
+
+function scheduleShowData() {
+  if (showDataPending) {
+    return;
+  }
+  showDataPending = true;
+  setTimeout(() => {
+    showDataPending = false;
+    showData();
+  }, 100);
+}
+
+function showData() {
+  const data = Array.from(dataItems.values());
+  const selectedType = document.getElementById("typeSelect").value;
+  populateTypes(data);
+  updateTable(
+    selectedType ? data.filter((item) => item.type === selectedType) : data
+  );
+  populateSelections(data);
+}
+
+function restoreSelection(select, value) {
+  if (Array.from(select.options).some((option) => option.value === value)) {
+    select.value = value;
+  }
+  select.nextElementSibling.disabled = !select.value;
+}
+
 function fetchCrates() {
-  fetch("/crates")
+  fetch("/crates?sort=mtime&order=desc")
     .then((response) => response.json())
     .then((data) => {
       const select = document.getElementById("crateSelect");
@@ -48,10 +115,10 @@ function fetchCrates() {
       option.value = "";
       option.textContent = "Select a crate";
       select.appendChild(option);
-      data.forEach((label) => {
+      data.forEach((crate) => {
         const option = document.createElement("option");
-        option.value = label;
-        option.textContent = label;
+        option.value = crate.name;
+        option.textContent = `${crate.name} (${crate.entities} entities)`;
         select.appendChild(option);
       });
     })
@@ -149,7 +216,7 @@ function fetchPlatformData() {
     fetch(
       `http://localhost:${platform_url}/data/ontology?type=${encodeURIComponent(
         selectedType
-      )}&format=ROC`,
+      )}&format=ROC&compact=true`,
       {
         method: "GET",
         headers: {
@@ -169,7 +236,7 @@ function fetchPlatformData() {
       })
       .then((zip) => processROCrates(zip))
       .then((jsonString) => {
-        const data = JSON.parse(jsonString);
+        const data = expandContexts(JSON.parse(jsonString));
         updatePlatformDataList(data);
         fetchCrates();
       })
@@ -182,6 +249,17 @@ function fetchPlatformData() {
   }
 }
 
+function expandContexts(data) {
+  if (!data["@contexts"]) {
+    return data;
+  }
+  return data.objects.map((item) =>
+    typeof item["@context"] === "string"
+      ? { ...item, "@context": data["@contexts"][item["@context"]] }
+      : item
+  );
+}
+
 function processROCrates(zip) {
   // TODO use the JS ROCrate library instead
   return new Promise((resolve, reject) => {
@@ -214,7 +292,7 @@ function processROCrates(zip) {
 function populateExportSamples(data) {
   const samplesList = data.filter((item) => item.type.includes("Sample"));
   const select = document.getElementById("exportSelect");
-  select.nextElementSibling.disabled = true;
+  const selected = select.value;
   select.innerHTML = "";
   const option = document.createElement("option");
   option.value = "";
@@ -226,6 +304,7 @@ function populateExportSamples(data) {
     option.textContent = item.id + " - " + item.title;
     select.appendChild(option);
   });
+  restoreSelection(select, selected);
 }
 
 function updatePlatformDataList(data) {
@@ -263,7 +342,6 @@ function importData(item) {
   })
     .then((response) => {
       if (response.ok) {
-        fetchData();
         hideMetadata();
       } else {
         response.json().then((data) => {
@@ -294,8 +372,12 @@ function exportData() {
         throw new Error("Failed to export data.");
       }
     })
-    .then((data) => {
+    .then((data) => waitForJob(data.status))
+    .then((job) => {
       fetchCrates();
+      if (job.state !== "succeeded") {
+        throw new Error(job.error);
+      }
       alert("Successfully exported data.");
     })
     .catch((error) => {
@@ -304,10 +386,22 @@ function exportData() {
     });
 }
 
+function waitForJob(url, interval = 500) {
+  return fetch(url)
+    .then((response) => response.json())
+    .then((job) => {
+      if (job.state === "queued" || job.state === "running") {
+        return new Promise((resolve) => setTimeout(resolve, interval)).then(
+          () => waitForJob(url, interval)
+        );
+      }
+      return job;
+    });
+}
+
 function resetData() {
   fetch("/data/reset").then(
     () => {
-      fetchData();
       fetchCrates();
       hideMetadata();
       hideCrateView();
@@ -320,6 +414,7 @@ function resetData() {
 function populateTypes(data) {
   const types = new Set(data.map((item) => item.type));
   const typeSelect = document.getElementById("typeSelect");
+  const selected = typeSelect.value;
   typeSelect.innerHTML = "";
   const option = document.createElement("option");
   option.value = "";
@@ -331,35 +426,16 @@ function populateTypes(data) {
     option.textContent = type;
     typeSelect.appendChild(option);
   });
+  if (types.has(selected)) {
+    typeSelect.value = selected;
+  }
 }
 
 function refreshData() {
-  fetchFilteredData();
+  showData();
   hideMetadata();
 }
 
-function fetchFilteredData() {
-  const selectedType = document.getElementById("typeSelect").value;
-  if (selectedType) {
-    fetch(`/data/filter?type=${encodeURIComponent(selectedType)}`)
-      .then((response) => response.json())
-      .then((data) => {
-        if (data.length > 0) {
-          updateTable(data);
-          hideError();
-        } else {
-          handleError("No data found for the selected type.");
-        }
-      })
-      .catch((error) => {
-        console.error("Error:", error);
-        handleError("Failed to fetch filtered data.");
-      });
-  } else {
-    fetchData();
-  }
-}
-
 function updateTable(data) {
   const createMetadataButton = (item) => {
     const resetOtherMetadataButtons = () => {
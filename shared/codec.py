@@ -0,0 +1,57 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def dumps(obj, default=None, sort_keys=False) -> bytes:
+    """Serialize `obj` to compact UTF-8 JSON, natively when orjson is installed."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default, option=option)
+    return json.dumps(
+        obj,
+        default=default,
+        sort_keys=sort_keys,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+def loads(data: bytes | str):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load(file):
+    return loads(file.read())
+
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider encoding with `dumps` and decoding with `loads`.
+
+    Responses are always compact.
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        sort_keys = kwargs.get("sort_keys", self.sort_keys)
+        return dumps(obj, default=self.default, sort_keys=sort_keys).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            dumps(obj, default=self.default, sort_keys=self.sort_keys),
+            mimetype=self.mimetype,
+        )
@@ -0,0 +1,88 @@
+import gzip
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ENCODERS = {
+    "gzip": lambda data, level: gzip.compress(data, compresslevel=level),
+}
+if brotli is not None:
+    ENCODERS["br"] = lambda data, level: brotli.compress(data, quality=level)
+if zstandard is not None:
+    ENCODERS["zstd"] = lambda data, level: zstandard.ZstdCompressor(
+        level=level
+    ).compress(data)
+
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+COMPRESSIBLE = {"application/json", "application/ld+json", "text/html"}
+
+
+class ResponseCompressor:
+    """An `after_request` hook compressing responses by `Accept-Encoding`.
+
+    Buffered responses of a compressible mimetype and at least `min_size`
+    bytes are encoded with the first of `encodings` the client accepts.
+    Encodings whose library is not installed are skipped. Streamed and file
+    responses are left untouched.
+    """
+
+    def __init__(
+        self,
+        min_size=1024,
+        encodings=("zstd", "br", "gzip"),
+        levels=None,
+        mimetypes=COMPRESSIBLE,
+    ):
+        self.min_size = min_size
+        self.encodings = [encoding for encoding in encodings if encoding in ENCODERS]
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.mimetypes = set(mimetypes)
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def __call__(self, response: Response) -> Response:
+        if (
+            not self.encodings
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in self.mimetypes
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        if not (encoding := request.accept_encodings.best_match(self.encodings)):
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        compressed = ENCODERS[encoding](data, self.levels[encoding])
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak)
+        self.compressed += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(compressed)
+        return response
+
+    def stats(self):
+        return {
+            "encodings": self.encodings,
+            "compressed": self.compressed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
@@ -0,0 +1,322 @@
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from threading import Lock
+from urllib.parse import unquote
+
+from shared import codec
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "ro-crate-metadata.json"
+
+
+def build_crate(
+    files: dict[str, bytes],
+    entity_type: str,
+    types: dict[str, str] | None = None,
+    compresslevel: int | None = None,
+) -> bytes:
+    """Build a zipped RO-Crate in memory with one entity per file.
+
+    Entities are typed `entity_type` unless `types` maps their file to another.
+    Members are deflated at `compresslevel` (zlib's default when None), or
+    stored uncompressed when it is 0.
+    """
+    from rocrate.rocrate import ROCrate
+
+    crate = ROCrate()
+    for filename, content in files.items():
+        crate.add_file(
+            BytesIO(content),
+            f"./{filename}",
+            properties={
+                "@type": (types or {}).get(filename, entity_type),
+            },
+        )
+    buffer = BytesIO()
+    with zipfile.ZipFile(
+        buffer,
+        "w",
+        compression=zipfile.ZIP_STORED if compresslevel == 0 else zipfile.ZIP_DEFLATED,
+        compresslevel=compresslevel or None,
+    ) as archive:
+        for filename, content in files.items():
+            archive.writestr(filename, content)
+        archive.writestr(MANIFEST, codec.dumps(crate.metadata.generate()))
+    return buffer.getvalue()
+
+
+def find_entities(zip_file: zipfile.ZipFile, entity_type: str) -> list[str]:
+    """Archive members of the data entities of `entity_type`, read from the manifest.
+
+    Raises ValueError if the manifest is missing or not a JSON-LD object with
+    a graph.
+    """
+    names = set(zip_file.namelist())
+    if MANIFEST not in names:
+        raise ValueError("Missing crate manifest.")
+    with zip_file.open(MANIFEST) as file:
+        try:
+            manifest = codec.load(file)
+        except ValueError as e:
+            raise ValueError("Invalid crate manifest.") from e
+    graph = manifest.get("@graph", []) if isinstance(manifest, dict) else None
+    if not isinstance(graph, list) or not all(
+        isinstance(entity, dict) for entity in graph
+    ):
+        raise ValueError("Invalid crate manifest.")
+    members = []
+    for entity in graph:
+        if entity_type not in _types(entity):
+            continue
+        if (member := unquote(entity.get("@id", "")).removeprefix("./")) in names:
+            members.append(member)
+    return members
+
+
+def find_entity(zip_file: zipfile.ZipFile, entity_type: str) -> str | None:
+    return next(iter(find_entities(zip_file, entity_type)), None)
+
+
+class CrateWriter:
+    """Persists zipped crates to disk off the request thread.
+
+    The zip is saved to `crate_folder` and its contents are unpacked into
+    `upload_folder`, mirroring `ROCrate.write_zip` and `ROCrate.write`.
+    Written crates are recorded in `index` when one is given. Clearing the
+    folders renames them aside and deletes them in the background.
+    """
+
+    def __init__(self, crate_folder, upload_folder, enabled=True, index=None):
+        self.crate_folder = Path(crate_folder)
+        self.upload_folder = Path(upload_folder)
+        self.enabled = enabled
+        self.index = index
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._cleaner = ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+
+    def submit(self, name: str, content: bytes):
+        if not self.enabled:
+            return None
+        future = self._executor.submit(self.write, name, content)
+        future.add_done_callback(self._report)
+        self._pending = [f for f in self._pending if not f.done()] + [future]
+        return future
+
+    def write(self, name: str, content: bytes):
+        self.crate_folder.mkdir(parents=True, exist_ok=True)
+        self.upload_folder.mkdir(parents=True, exist_ok=True)
+        path = self.crate_folder / f"{name}.zip"
+        path.write_bytes(content)
+        if self.index is not None:
+            self.index.record(path, content)
+        with zipfile.ZipFile(BytesIO(content), "r") as zip_file:
+            zip_file.extractall(self.upload_folder)
+        return path
+
+    def wait(self):
+        for future in self._pending:
+            future.exception()
+        self._pending = []
+
+    def clear(self):
+        self.wait()
+        for folder in (self.crate_folder, self.upload_folder):
+            if folder.exists():
+                trash = folder.with_name(f".{folder.name}-{uuid.uuid4().hex}")
+                folder.rename(trash)
+                self._cleaner.submit(shutil.rmtree, trash, ignore_errors=True)
+            folder.mkdir(parents=True)
+
+    @staticmethod
+    def _report(future):
+        if exception := future.exception():
+            logger.error("Error persisting crate", exc_info=exception)
+
+
+class CrateCache:
+    """Finished crate bytes keyed by (endpoint, query, data version).
+
+    Entries are evicted least recently used first once either `maxsize`
+    entries or `max_bytes` of content are exceeded. Each entry carries an
+    ETag derived from its content.
+    """
+
+    def __init__(self, maxsize=64, max_bytes=64 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._entries: OrderedDict[tuple, tuple[bytes, str]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key) -> tuple[bytes, str] | None:
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, content: bytes) -> tuple[bytes, str]:
+        entry = content, hashlib.sha1(content).hexdigest()
+        with self._lock:
+            if (previous := self._entries.pop(key, None)) is not None:
+                self._size -= len(previous[0])
+            self._entries[key] = entry
+            self._size += len(content)
+            while self._entries and (
+                len(self._entries) > self.maxsize or self._size > self.max_bytes
+            ):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return entry
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CrateIndex:
+    """Summaries and parsed manifests of the zipped crates in `folder`.
+
+    Each crate is summarized by name, size, mtime, number and types of data
+    entities, and content hash. Summaries are only recomputed for files whose
+    mtime or size changed, and the `maxsize` most recently used manifests are
+    kept parsed, validated the same way.
+    """
+
+    SORT_KEYS = ("name", "size", "mtime", "entities")
+
+    def __init__(self, folder, maxsize=64):
+        self.folder = Path(folder)
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[str, dict] = {}
+        self._versions: dict[str, tuple[int, int]] = {}
+        self._manifests: OrderedDict[str, tuple[tuple[int, int], dict]] = OrderedDict()
+        self._lock = Lock()
+
+    def list(self, sort="name", descending=False) -> list[dict]:
+        if sort not in self.SORT_KEYS:
+            raise ValueError(f"Cannot sort crates by {sort!r}.")
+        self.refresh()
+        with self._lock:
+            entries = list(self._entries.values())
+        return sorted(entries, key=lambda entry: entry[sort], reverse=descending)
+
+    def manifest(self, name: str) -> dict | None:
+        path = self.folder / name
+        if path.parent != self.folder or not path.is_file():
+            return None
+        version = _version(path.stat())
+        with self._lock:
+            cached = self._manifests.get(name)
+            if cached and cached[0] == version:
+                self._manifests.move_to_end(name)
+                self.hits += 1
+                return cached[1]
+        self.misses += 1
+        with zipfile.ZipFile(path, "r") as zip_file:
+            manifest = _read_manifest(zip_file)
+        if manifest is not None:
+            self._remember(name, version, manifest)
+        return manifest
+
+    def record(self, path: Path, content: bytes):
+        stat = path.stat()
+        entry, manifest = _summarize(path, content)
+        version = _version(stat)
+        with self._lock:
+            self._entries[path.name] = {**entry, "mtime": stat.st_mtime}
+            self._versions[path.name] = version
+        if manifest is not None:
+            self._remember(path.name, version, manifest)
+
+    def refresh(self):
+        if not self.folder.is_dir():
+            with self._lock:
+                self._entries.clear()
+                self._versions.clear()
+                self._manifests.clear()
+            return
+        present = set()
+        for dir_entry in os.scandir(self.folder):
+            if not dir_entry.is_file():
+                continue
+            present.add(dir_entry.name)
+            stat = dir_entry.stat()
+            if self._versions.get(dir_entry.name) != _version(stat):
+                path = Path(dir_entry.path)
+                self.record(path, path.read_bytes())
+        with self._lock:
+            for name in set(self._entries) - present:
+                del self._entries[name]
+                del self._versions[name]
+                self._manifests.pop(name, None)
+
+    def stats(self):
+        return {
+            "crates": len(self._entries),
+            "manifests": len(self._manifests),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _remember(self, name, version, manifest):
+        with self._lock:
+            self._manifests[name] = version, manifest
+            self._manifests.move_to_end(name)
+            while len(self._manifests) > self.maxsize:
+                self._manifests.popitem(last=False)
+
+
+def _version(stat) -> tuple[int, int]:
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_manifest(zip_file: zipfile.ZipFile) -> dict | None:
+    try:
+        with zip_file.open(MANIFEST) as manifest:
+            return codec.load(manifest)
+    except (KeyError, ValueError):
+        return None
+
+
+def _summarize(path: Path, content: bytes) -> tuple[dict, dict | None]:
+    try:
+        with zipfile.ZipFile(BytesIO(content), "r") as zip_file:
+            manifest = _read_manifest(zip_file)
+    except zipfile.BadZipFile:
+        manifest = None
+    graph = manifest.get("@graph", []) if manifest else []
+    entities = [entity for entity in graph if entity.get("@id") not in ("./", MANIFEST)]
+    types = {entity_type for entity in entities for entity_type in _types(entity)}
+    return {
+        "name": path.name,
+        "size": len(content),
+        "entities": len(entities),
+        "types": sorted(types),
+        "sha1": hashlib.sha1(content).hexdigest(),
+    }, manifest
+
+
+def _types(entity: dict) -> list[str]:
+    types = entity.get("@type", [])
+    return types if isinstance(types, list) else [types]
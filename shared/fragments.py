@@ -0,0 +1,77 @@
+from threading import Lock
+
+from shared.store import ObjectStore
+
+
+class FragmentCache:
+    """Serialized objects, kept until the store reports them changed.
+
+    `renderers` map a variant name to a function serializing an object to
+    bytes. Fragments are dropped when the store's change log mentions their
+    object, all at once after a reset, and per ontology through
+    `invalidate_ontology` when a context changes. Fragments rendered while
+    the store changed are returned but not kept.
+    """
+
+    def __init__(self, store: ObjectStore, renderers: dict):
+        self.store = store
+        self.renderers = renderers
+        self.hits = 0
+        self.misses = 0
+        self._fragments: dict[tuple[str, str], bytes] = {}
+        self._sequence = store.version
+        self._lock = Lock()
+
+    def get(self, item: dict, variant: str) -> bytes:
+        (fragment,) = self.fragments([item], variant)
+        return fragment
+
+    def fragments(self, items, variant: str):
+        """Yield the fragments of `items`, keeping new ones once exhausted."""
+        sequence = self._sync()
+        rendered = {}
+        for item in items:
+            key = (variant, item["id"])
+            if (fragment := self._fragments.get(key)) is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                fragment = rendered[key] = self.renderers[variant](item)
+            yield fragment
+        if rendered and self.store.version == sequence:
+            self._fragments.update(rendered)
+
+    def join(self, items, variant: str) -> bytes:
+        return b"[" + b",".join(self.fragments(items, variant)) + b"]"
+
+    def invalidate_ontology(self, ontology: str):
+        with self._lock:
+            for item in self.store.filter_by_ontology(ontology):
+                self._drop(item["id"])
+
+    def stats(self):
+        return {
+            "fragments": len(self._fragments),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _sync(self) -> int:
+        if self.store.version == self._sequence:
+            return self._sequence
+        with self._lock:
+            version = self.store.version
+            changes, reset = self.store.changes.since(self._sequence)
+            if reset:
+                self._fragments.clear()
+                self._sequence = version
+                return version
+            for change in changes:
+                if change["id"] is not None:
+                    self._drop(change["id"])
+            self._sequence = max([version] + [change["seq"] for change in changes])
+            return self._sequence
+
+    def _drop(self, object_id: str):
+        for variant in self.renderers:
+            self._fragments.pop((variant, object_id), None)
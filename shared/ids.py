@@ -0,0 +1,59 @@
+class IdAllocator:
+    """Hands out `PREFIX-n` ids per object type from blocks reserved in a store.
+
+    `ids` maps each object type to its prefix and the last reserved counter,
+    and is persisted in the store under `state_key`. Reserving a block
+    advances that counter by `block_size` in one store batch, so threads and
+    processes sharing the store never hand out the same id; the ids of a
+    block are then handed out locally, still under the store's write lock.
+    Blocks are dropped when the store is reset or the batch reserving them
+    is rolled back. Ids left in a block when the process exits are skipped.
+    """
+
+    def __init__(self, store, ids: dict, block_size=16, state_key="ids"):
+        self.store = store
+        self.ids = ids
+        self.block_size = block_size
+        self.state_key = state_key
+        self._blocks: dict[str, tuple[int, int, int]] = {}
+        with store.batch():
+            if (saved := store.get_state(state_key)) is not None:
+                ids.clear()
+                ids.update(saved)
+            else:
+                store.set_state(state_key, ids)
+
+    def allocate(self, object_type: str, count=1) -> list[str]:
+        """`count` consecutive new ids for `object_type`."""
+        with self.store.batch():
+            generation = self.store.generation
+            block = self._blocks.get(object_type)
+            if block and block[0] == generation and block[2] - block[1] >= count:
+                start, end = block[1:]
+            else:
+                start, end = self._reserve(object_type, max(count, self.block_size))
+            self._blocks[object_type] = generation, start + count, end
+        prefix = self.ids[object_type]["prefix"]
+        return [f"{prefix}-{counter}" for counter in range(start, start + count)]
+
+    def next_id(self, object_type: str) -> str:
+        return self.allocate(object_type)[0]
+
+    def reset(self, ids: dict):
+        """Restart every counter from `ids` and drop reserved blocks."""
+        ids = dict(ids)
+        with self.store.batch():
+            self._blocks.clear()
+            self.ids.clear()
+            self.ids.update(ids)
+            self.store.set_state(self.state_key, self.ids)
+
+    def _reserve(self, object_type: str, count: int) -> tuple[int, int]:
+        if (saved := self.store.get_state(self.state_key)) not in (None, self.ids):
+            self.ids.clear()
+            self.ids.update(saved)
+        counter = self.ids[object_type]["counter"]
+        self.ids[object_type] = {**self.ids[object_type], "counter": counter + count}
+        self.store.set_state(self.state_key, self.ids)
+        self.store.on_rollback(lambda: self._blocks.pop(object_type, None))
+        return counter + 1, counter + count + 1
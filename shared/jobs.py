@@ -0,0 +1,111 @@
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class JobFailed(Exception):
+    """A job failure that still carries a result, e.g. a peer's error response."""
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+class JobQueue:
+    """Runs jobs on a bounded thread pool and records their state and timings.
+
+    Only the `history` most recent jobs are kept for status queries. Given a
+    `store`, job records are also saved in its state under `state_key`, so
+    every process sharing the store can report any job; `stats` only counts
+    the jobs of this process.
+    """
+
+    def __init__(self, workers=4, history=1000, store=None, state_key="jobs"):
+        self.history = history
+        self.store = store
+        self.state_key = state_key
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._jobs: OrderedDict[str, dict] = OrderedDict()
+        self._lock = Lock()
+
+    def submit(self, kind: str, function, *args, **kwargs) -> dict:
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "state": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        if self.store is not None:
+            with self.store.batch():
+                self.store.set_state(self._key(job["id"]), dict(job))
+                ids = [*self.store.get_state(self.state_key, []), job["id"]]
+                for job_id in ids[: -self.history]:
+                    self.store.delete_state(self._key(job_id))
+                self.store.set_state(self.state_key, ids[-self.history :])
+        self._executor.submit(self._run, job, function, args, kwargs)
+        return dict(job)
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.get_state(self._key(job_id))
+        if job is None:
+            return None
+        job = dict(job)
+        end = job["finished_at"] or time.time()
+        job["queued_for"] = (job["started_at"] or end) - job["submitted_at"]
+        job["ran_for"] = end - job["started_at"] if job["started_at"] else 0.0
+        return job
+
+    def stats(self):
+        with self._lock:
+            states = [job["state"] for job in self._jobs.values()]
+        return {state: states.count(state) for state in set(states)}
+
+    def _run(self, job, function, args, kwargs):
+        job["state"] = "running"
+        job["started_at"] = time.time()
+        self._save(job)
+        try:
+            job["result"] = function(*args, **kwargs)
+            job["state"] = "succeeded"
+        except JobFailed as e:
+            job["result"] = e.result
+            job["error"] = str(e)
+            job["state"] = "failed"
+        except Exception as e:
+            logger.error("Job %s failed", job["id"], exc_info=e)
+            job["error"] = str(e)
+            job["state"] = "failed"
+        finally:
+            job["finished_at"] = time.time()
+            self._save(job)
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.state_key}:{job_id}"
+
+    def _save(self, job):
+        """Update the saved record of `job`, unless a store reset dropped it."""
+        if self.store is None:
+            return
+        key = self._key(job["id"])
+        try:
+            with self.store.batch():
+                if self.store.get_state(key) is not None:
+                    self.store.set_state(key, dict(job))
+        except Exception as e:
+            logger.error("Failed to save the state of job %s", job["id"], exc_info=e)
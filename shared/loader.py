@@ -0,0 +1,123 @@
+import hashlib
+import json
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+_installed = None
+
+
+def jsonld():
+    """pyld's `jsonld` module, imported on first use.
+
+    The document loader passed to `CachedDocumentLoader.install` is set on
+    the module before it is returned.
+    """
+    global _installed
+    from pyld import jsonld
+
+    if _installed is not None:
+        jsonld.set_document_loader(_installed)
+        _installed = None
+    return jsonld
+
+
+class CachedDocumentLoader:
+    """A pyld document loader serving contexts from memory and disk.
+
+    Documents are looked up in an in-memory LRU first, then in `cache_dir`.
+    The network is only used when `allow_network` is set, and fetched
+    documents are written back to both caches.
+    """
+
+    def __init__(self, cache_dir=None, maxsize=256, allow_network=False, timeout=10):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.maxsize = maxsize
+        self.allow_network = allow_network
+        self.timeout = timeout
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self._documents: OrderedDict[str, dict] = OrderedDict()
+        self._lock = Lock()
+        self._remote = None
+
+    def __call__(self, url, options=None):
+        with self._lock:
+            if (document := self._documents.get(url)) is not None:
+                self._documents.move_to_end(url)
+                self.hits += 1
+                return _remote_document(url, document)
+        if (document := self._read(url)) is not None:
+            self.disk_hits += 1
+            self._remember(url, document)
+            return _remote_document(url, document)
+        self.misses += 1
+        if not self.allow_network:
+            raise jsonld().JsonLdError(
+                "Remote context is not cached and network access is disabled.",
+                "jsonld.LoadDocumentError",
+                {"url": url},
+                code="loading document failed",
+            )
+        if self._remote is None:
+            self._remote = jsonld().requests_document_loader(timeout=self.timeout)
+        remote = self._remote(url, options)
+        self.fetches += 1
+        self.preload(url, remote["document"])
+        return remote
+
+    def preload(self, url, document):
+        self._remember(url, document)
+        self._write(url, document)
+
+    def preload_contexts(self, contexts: dict[str, dict]):
+        for url, document in contexts.items():
+            self._remember(url, document)
+
+    def install(self):
+        global _installed
+        _installed = self
+        return self
+
+    def stats(self):
+        return {
+            "documents": len(self._documents),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "fetches": self.fetches,
+        }
+
+    def _remember(self, url, document):
+        with self._lock:
+            self._documents[url] = document
+            self._documents.move_to_end(url)
+            while len(self._documents) > self.maxsize:
+                self._documents.popitem(last=False)
+
+    def _path(self, url):
+        return self.cache_dir / f"{hashlib.sha1(url.encode()).hexdigest()}.json"
+
+    def _read(self, url):
+        if not self.cache_dir or not (path := self._path(url)).exists():
+            return None
+        with path.open("r") as file:
+            return json.load(file)["document"]
+
+    def _write(self, url, document):
+        if not self.cache_dir:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with self._path(url).open("w") as file:
+            json.dump({"url": url, "document": document}, file)
+
+
+def _remote_document(url, document):
+    return {
+        "contentType": "application/ld+json",
+        "contextUrl": None,
+        "documentUrl": url,
+        "document": document,
+    }
@@ -0,0 +1,118 @@
+import time
+from threading import Lock
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+
+class PeerError(Exception):
+    """A peer platform could not be reached."""
+
+
+class PeerClient:
+    """Keep-alive HTTP sessions to peer platforms, one pool per peer port.
+
+    Connection errors are retried with exponential backoff for any method,
+    read errors and gateway failures only for idempotent methods. Every
+    request is bounded by the connect and read timeouts, and failures are
+    raised as `PeerError`. `requests` is imported and sessions are opened
+    on first use, or for every platform by `connect`.
+    """
+
+    def __init__(
+        self,
+        platforms: dict[str, int],
+        host="localhost",
+        connect_timeout=3.05,
+        read_timeout=60,
+        retries=3,
+        backoff=0.5,
+        pool_size=10,
+    ):
+        self.host = host
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.platforms = platforms
+        self._sessions: dict[int, "requests.Session"] = {}
+        self._stats: dict[int, dict] = {}
+        self._lock = Lock()
+
+    def connect(self):
+        for port in self.platforms.values():
+            self.session(port)
+
+    def session(self, port) -> "requests.Session":
+        port = int(port)
+        with self._lock:
+            if (session := self._sessions.get(port)) is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                retry = Retry(
+                    total=self.retries,
+                    backoff_factor=self.backoff,
+                    status_forcelist=(502, 503, 504),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_size,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[port] = session
+                self._stats[port] = {
+                    "requests": 0,
+                    "failures": 0,
+                    "total_latency": 0.0,
+                    "max_latency": 0.0,
+                }
+            return session
+
+    def request(self, method, port, path, **kwargs) -> "requests.Response":
+        import requests
+
+        session = self.session(port)
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        try:
+            return session.request(method, f"http://{self.host}:{port}{path}", **kwargs)
+        except requests.RequestException as e:
+            with self._lock:
+                self._stats[int(port)]["failures"] += 1
+            raise PeerError(str(e)) from e
+        finally:
+            latency = time.perf_counter() - start
+            with self._lock:
+                stats = self._stats[int(port)]
+                stats["requests"] += 1
+                stats["total_latency"] += latency
+                stats["max_latency"] = max(stats["max_latency"], latency)
+
+    def get(self, port, path, **kwargs) -> "requests.Response":
+        return self.request("GET", port, path, **kwargs)
+
+    def post(self, port, path, **kwargs) -> "requests.Response":
+        return self.request("POST", port, path, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                port: {
+                    **stats,
+                    "mean_latency": stats["total_latency"] / (stats["requests"] or 1),
+                    "connections": _connections(self._sessions[port]),
+                }
+                for port, stats in self._stats.items()
+            }
+
+
+def _connections(session: "requests.Session") -> int:
+    pools = session.get_adapter("http://").poolmanager.pools
+    return sum(pools[key].num_connections for key in pools.keys())
@@ -0,0 +1,626 @@
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Condition, RLock
+
+from shared import codec
+from shared.store import ObjectStore, _ids
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    type TEXT NOT NULL,
+    type_key TEXT NOT NULL,
+    title TEXT NOT NULL,
+    ontology TEXT NOT NULL,
+    ontology_key TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    origin_port INTEGER,
+    origin_id TEXT
+);
+CREATE INDEX IF NOT EXISTS objects_type ON objects (type_key, position);
+CREATE INDEX IF NOT EXISTS objects_ontology ON objects (ontology_key, position);
+CREATE INDEX IF NOT EXISTS objects_origin ON objects (origin_port, origin_id);
+CREATE TABLE IF NOT EXISTS links (
+    source TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    child TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS links_source ON links (source);
+CREATE INDEX IF NOT EXISTS links_parent ON links (parent);
+CREATE INDEX IF NOT EXISTS links_child ON links (child);
+CREATE TABLE IF NOT EXISTS received (
+    port INTEGER NOT NULL,
+    origin_id TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (port, origin_id)
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    object_id TEXT,
+    source INTEGER
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    name TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    objects INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot_objects AS
+    SELECT '' AS snapshot, * FROM objects WHERE 0;
+CREATE INDEX IF NOT EXISTS snapshot_objects_snapshot ON snapshot_objects (snapshot);
+CREATE TABLE IF NOT EXISTS snapshot_links AS
+    SELECT '' AS snapshot, * FROM links WHERE 0;
+CREATE INDEX IF NOT EXISTS snapshot_links_snapshot ON snapshot_links (snapshot);
+CREATE TABLE IF NOT EXISTS snapshot_received AS
+    SELECT '' AS snapshot, * FROM received WHERE 0;
+CREATE INDEX IF NOT EXISTS snapshot_received_snapshot ON snapshot_received (snapshot);
+CREATE TABLE IF NOT EXISTS snapshot_state AS
+    SELECT '' AS snapshot, * FROM state WHERE 0;
+CREATE INDEX IF NOT EXISTS snapshot_state_snapshot ON snapshot_state (snapshot);
+"""
+
+COLUMNS = "position, id, type, title, metadata, ontology"
+
+SNAPSHOT_TABLES = {
+    "objects": "position, id, type, type_key, title, ontology, ontology_key,"
+    " metadata, origin_port, origin_id",
+    "links": "source, parent, child",
+    "received": "port, origin_id, digest",
+}
+
+STORE_STATE = ("epoch", "generation")
+
+
+class SQLiteChangeLog:
+    """A `ChangeLog` kept in the store's database and shared by its processes.
+
+    Waiters are woken by commits made in this process and otherwise poll the
+    database every `poll_interval` seconds.
+    """
+
+    def __init__(self, store: "SQLiteObjectStore", maxlen=10000, poll_interval=0.5):
+        self.store = store
+        self.maxlen = maxlen
+        self.poll_interval = poll_interval
+        self._condition = Condition()
+        with store.batch():
+            if (epoch := store.get_state("epoch")) is None:
+                epoch = uuid.uuid4().hex
+                store.set_state("epoch", epoch)
+        self.epoch = epoch
+
+    @property
+    def sequence(self) -> int:
+        return self.store._scalar("SELECT COALESCE(MAX(seq), 0) FROM changes")
+
+    def append(
+        self, op: str, object_id: str | None = None, source: int | None = None
+    ) -> int:
+        with self.store.batch() as connection:
+            sequence = connection.execute(
+                "INSERT INTO changes (op, object_id, source) VALUES (?, ?, ?)",
+                (op, object_id, source),
+            ).lastrowid
+            connection.execute(
+                "DELETE FROM changes WHERE seq <= ?", (sequence - self.maxlen,)
+            )
+        return sequence
+
+    def since(self, sequence: int) -> tuple[list[dict], bool]:
+        with self.store._snapshot() as connection:
+            current, oldest = connection.execute(
+                "SELECT COALESCE(MAX(seq), 0), MIN(seq) FROM changes"
+            ).fetchone()
+            if sequence == current:
+                return [], False
+            if sequence > current or oldest is None or oldest > sequence + 1:
+                return [], True
+            rows = connection.execute(
+                "SELECT seq, op, object_id, source FROM changes"
+                " WHERE seq > ? ORDER BY seq",
+                (sequence,),
+            ).fetchall()
+        changes = [
+            {"seq": seq, "op": op, "id": object_id, "source": source}
+            for seq, op, object_id, source in rows
+        ]
+        if any(change["op"] == "reset" for change in changes):
+            return [], True
+        return changes, False
+
+    def wait(self, sequence: int, timeout=None) -> tuple[list[dict], bool]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.sequence == sequence:
+            remaining = self.poll_interval
+            if deadline is not None:
+                remaining = min(remaining, deadline - time.monotonic())
+            if remaining <= 0:
+                break
+            with self._condition:
+                self._condition.wait(remaining)
+        return self.since(sequence)
+
+    def notify(self):
+        with self._condition:
+            self._condition.notify_all()
+
+
+class SQLiteObjectStore(ObjectStore):
+    """An `ObjectStore` persisted in a SQLite database in WAL mode.
+
+    Objects are read from the database when needed instead of being loaded
+    at startup, and `items` only seed a new database. Every thread reads
+    through its own connection, so reads run concurrently, while mutations
+    are written in one transaction per outermost `batch`. The change log and
+    the values saved with `set_state` live in the same database, so several
+    processes can share it. Snapshots are copied table to table within the
+    database.
+    """
+
+    def __init__(
+        self,
+        path,
+        items=(),
+        history=10000,
+        provenance_key=None,
+        parent_key=None,
+        children_key=None,
+        timeout=30,
+    ):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.provenance_key = provenance_key
+        self.parent_key = parent_key
+        self.children_key = children_key
+        self._local = threading.local()
+        self._write_lock = RLock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        connection.execute("DROP INDEX IF EXISTS objects_title")
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(changes)")]
+        if "source" not in columns:
+            connection.execute("ALTER TABLE changes ADD COLUMN source INTEGER")
+        self.changes = SQLiteChangeLog(self, maxlen=history)
+        with self.batch():
+            if self.get_state("generation") is None:
+                self.load(items)
+
+    @property
+    def _generation(self) -> int:
+        return self.get_state("generation", 0)
+
+    def load(self, items):
+        items = list(items)
+        with self.batch() as connection:
+            for table in ("objects", "links", "received"):
+                connection.execute(f"DELETE FROM {table}")
+            connection.executemany(
+                "INSERT INTO objects (id, type, type_key, title, ontology,"
+                " ontology_key, metadata, origin_port, origin_id)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._row(item) for item in items],
+            )
+            connection.executemany(
+                "INSERT INTO links (source, parent, child) VALUES (?, ?, ?)",
+                [link for item in items for link in self._links_of(item)],
+            )
+            self.set_state("generation", self.changes.append("reset"))
+
+    def __len__(self):
+        return self._scalar("SELECT COUNT(*) FROM objects")
+
+    def __iter__(self):
+        return iter(self._select())
+
+    def __contains__(self, object_id):
+        return (
+            self._scalar("SELECT COUNT(*) FROM objects WHERE id = ?", (object_id,)) > 0
+        )
+
+    def get(self, object_id) -> dict | None:
+        return next(iter(self._select("WHERE id = ?", (object_id,))), None)
+
+    def filter_by_type(self, object_type: str) -> list[dict]:
+        return self._select("WHERE type_key = ?", (object_type.lower(),))
+
+    def filter_by_ontology(self, ontology: str) -> list[dict]:
+        return self._select("WHERE ontology_key = ?", (ontology.lower(),))
+
+    def page(
+        self, cursor=None, limit=None, object_type=None, ontology=None
+    ) -> tuple[list[dict], str | None]:
+        if limit is not None and limit < 1:
+            raise ValueError("Limit must be positive.")
+        start = self._decode_cursor(cursor) if cursor else 0
+        suffix = "" if limit is None else f"LIMIT {limit + 1}"
+        rows = self._page_rows(start, object_type, ontology, suffix)
+        if limit is None or len(rows) <= limit:
+            return [_item(row) for row in rows], None
+        rows = rows[:limit]
+        return [_item(row) for row in rows], f"{self._generation}.{rows[-1][0] + 1}"
+
+    def scan(self, cursor=None, object_type=None, ontology=None, chunk=256):
+        """An iterator over every matching object after `cursor`, like `page`.
+
+        The cursor is checked at once, then rows are fetched `chunk` at a
+        time, so iterating a whole table holds one chunk in memory.
+        """
+        start = self._decode_cursor(cursor) if cursor else 0
+
+        def items(start):
+            while rows := self._page_rows(
+                start, object_type, ontology, f"LIMIT {chunk}"
+            ):
+                yield from map(_item, rows)
+                start = rows[-1][0] + 1
+
+        return items(start)
+
+    def _page_rows(self, start: int, object_type, ontology, suffix) -> list[tuple]:
+        clauses = ["position >= ?"]
+        params: list = [start]
+        if object_type:
+            clauses.append("type_key = ?")
+            params.append(object_type.lower())
+        if ontology:
+            clauses.append("ontology_key = ?")
+            params.append(ontology.lower())
+        return self._rows(f"WHERE {' AND '.join(clauses)}", params, suffix)
+
+    def find_imported(self, port: int, origin_id: str) -> dict | None:
+        rows = self._rows(
+            "WHERE origin_port = ? AND origin_id = ?",
+            (int(port), origin_id),
+            "DESC LIMIT 1",
+        )
+        return _item(rows[0]) if rows else None
+
+    def received_hash(self, port: int, origin_id: str) -> str | None:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT digest FROM received WHERE port = ? AND origin_id = ?",
+                (int(port), origin_id),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def mark_received(self, port: int, origin_id: str, digest: str):
+        with self.batch() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO received (port, origin_id, digest)"
+                " VALUES (?, ?, ?)",
+                (int(port), origin_id, digest),
+            )
+
+    def children(self, object_id: str) -> list[str]:
+        return self._linked("child", "parent", object_id)
+
+    def parents(self, object_id: str) -> list[str]:
+        return self._linked("parent", "child", object_id)
+
+    @contextmanager
+    def batch(self):
+        """Run the enclosed mutations in one transaction.
+
+        Nested batches become savepoints, so a failing inner batch only
+        discards its own writes.
+        """
+        connection = self._connection()
+        depth = self._local.depth
+        if depth:
+            savepoint = f"batch_{depth}"
+            connection.execute(f"SAVEPOINT {savepoint}")
+            self._local.depth += 1
+            try:
+                yield connection
+            except BaseException:
+                connection.execute(f"ROLLBACK TO {savepoint}")
+                self._end_batch(depth + 1, rolled_back=True)
+                raise
+            else:
+                self._end_batch(depth + 1, rolled_back=False)
+            finally:
+                connection.execute(f"RELEASE {savepoint}")
+                self._local.depth -= 1
+            return
+        with self._write_lock:
+            connection.execute("BEGIN IMMEDIATE")
+            self._local.depth = 1
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                self._end_batch(1, rolled_back=True)
+                raise
+            else:
+                connection.execute("COMMIT")
+                self._end_batch(1, rolled_back=False)
+            finally:
+                self._local.depth = 0
+        if getattr(self, "changes", None) is not None:
+            self.changes.notify()
+
+    def on_rollback(self, callback):
+        if self._local.depth:
+            self._local.rollbacks.append((self._local.depth, callback))
+
+    def _end_batch(self, depth: int, rolled_back: bool):
+        callbacks = []
+        for level, callback in self._local.rollbacks:
+            if level < depth:
+                callbacks.append((level, callback))
+            elif rolled_back:
+                callback()
+            elif depth > 1:
+                callbacks.append((depth - 1, callback))
+        self._local.rollbacks = callbacks
+
+    def snapshots(self) -> list[dict]:
+        rows = (
+            self._connection()
+            .execute("SELECT name, created, objects FROM snapshots ORDER BY created")
+            .fetchall()
+        )
+        return [
+            {"name": name, "created": created, "objects": objects}
+            for name, created, objects in rows
+        ]
+
+    def snapshot(self, name: str):
+        with self.batch() as connection:
+            if self._has_snapshot(name):
+                raise KeyError(f"Snapshot {name} already exists.")
+            for table, columns in SNAPSHOT_TABLES.items():
+                connection.execute(
+                    f"INSERT INTO snapshot_{table} (snapshot, {columns})"
+                    f" SELECT ?, {columns} FROM {table}",
+                    (name,),
+                )
+            connection.execute(
+                "INSERT INTO snapshot_state (snapshot, key, value)"
+                f" SELECT ?, key, value FROM state WHERE key NOT IN {STORE_STATE}",
+                (name,),
+            )
+            connection.execute(
+                "INSERT INTO snapshots (name, created, objects)"
+                " SELECT ?, ?, COUNT(*) FROM objects",
+                (name, time.time()),
+            )
+
+    def restore(self, name: str):
+        with self.batch() as connection:
+            if not self._has_snapshot(name):
+                raise KeyError(f"Snapshot {name} not found.")
+            for table, columns in SNAPSHOT_TABLES.items():
+                connection.execute(f"DELETE FROM {table}")
+                connection.execute(
+                    f"INSERT INTO {table} ({columns})"
+                    f" SELECT {columns} FROM snapshot_{table} WHERE snapshot = ?",
+                    (name,),
+                )
+            connection.execute(f"DELETE FROM state WHERE key NOT IN {STORE_STATE}")
+            connection.execute(
+                "INSERT INTO state (key, value)"
+                " SELECT key, value FROM snapshot_state WHERE snapshot = ?",
+                (name,),
+            )
+            self.set_state("generation", self.changes.append("reset"))
+
+    def drop_snapshot(self, name: str):
+        with self.batch() as connection:
+            if not self._has_snapshot(name):
+                raise KeyError(f"Snapshot {name} not found.")
+            for table in [*SNAPSHOT_TABLES, "state"]:
+                connection.execute(
+                    f"DELETE FROM snapshot_{table} WHERE snapshot = ?", (name,)
+                )
+            connection.execute("DELETE FROM snapshots WHERE name = ?", (name,))
+
+    def _has_snapshot(self, name: str) -> bool:
+        return (
+            self._scalar("SELECT COUNT(*) FROM snapshots WHERE name = ?", (name,)) > 0
+        )
+
+    def get_state(self, key: str, default=None):
+        row = (
+            self._connection()
+            .execute("SELECT value FROM state WHERE key = ?", (key,))
+            .fetchone()
+        )
+        return default if row is None else codec.loads(row[0])
+
+    def set_state(self, key: str, value):
+        with self.batch() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                (key, codec.dumps(value).decode()),
+            )
+
+    def delete_state(self, key: str):
+        with self.batch() as connection:
+            connection.execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def add(self, item: dict, source: int | None = None):
+        with self.batch() as connection:
+            try:
+                connection.execute(
+                    "INSERT INTO objects (id, type, type_key, title, ontology,"
+                    " ontology_key, metadata, origin_port, origin_id)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._row(item),
+                )
+            except sqlite3.IntegrityError as e:
+                raise KeyError(f"Object {item['id']} already exists.") from e
+            self._write_links(connection, item)
+            self.changes.append("add", item["id"], source)
+        return item
+
+    def update_metadata(
+        self, object_id: str, metadata: dict, source: int | None = None
+    ) -> bool:
+        with self.batch() as connection:
+            current = self._metadata(connection, object_id)
+            if all(
+                key in current and current[key] == value
+                for key, value in metadata.items()
+            ):
+                return False
+            current.update(metadata)
+            self._write_metadata(connection, object_id, current)
+            self.changes.append("update", object_id, source)
+        return True
+
+    def add_child(self, parent_id: str, child_id: str):
+        # Appends to the stored children in SQL and adds the one link row,
+        # so the cost does not grow with the number of children.
+        path = f'$."{self.children_key}"'
+        with self.batch() as connection:
+            linked = connection.execute(
+                "SELECT COUNT(*) FROM links WHERE source = ? AND parent = ? AND child = ?",
+                (parent_id, parent_id, child_id),
+            ).fetchone()[0]
+            if not linked:
+                updated = connection.execute(
+                    "UPDATE objects SET metadata = CASE json_type(metadata, ?1)"
+                    " WHEN 'array' THEN json_insert(metadata, ?1 || '[#]', ?2)"
+                    " WHEN 'text' THEN json_set(metadata, ?1,"
+                    " json_array(json_extract(metadata, ?1), ?2))"
+                    " ELSE json_set(metadata, ?1, json_array(?2)) END"
+                    " WHERE id = ?3",
+                    (path, child_id, parent_id),
+                ).rowcount
+                if not updated:
+                    raise KeyError(parent_id)
+                connection.execute(
+                    "INSERT INTO links (source, parent, child) VALUES (?, ?, ?)",
+                    (parent_id, parent_id, child_id),
+                )
+                self.changes.append("update", parent_id)
+        return self.get(parent_id)
+
+    def _connection(self) -> sqlite3.Connection:
+        if (connection := getattr(self._local, "connection", None)) is None:
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.depth = 0
+            self._local.rollbacks = []
+        return connection
+
+    @contextmanager
+    def _snapshot(self):
+        connection = self._connection()
+        if connection.in_transaction:
+            yield connection
+            return
+        connection.execute("BEGIN")
+        try:
+            yield connection
+        finally:
+            connection.execute("COMMIT")
+
+    def _scalar(self, query: str, params=()):
+        return self._connection().execute(query, params).fetchone()[0]
+
+    def _rows(self, where="", params=(), suffix="") -> list[tuple]:
+        return (
+            self._connection()
+            .execute(
+                f"SELECT {COLUMNS} FROM objects {where} ORDER BY position {suffix}",
+                params,
+            )
+            .fetchall()
+        )
+
+    def _select(self, where="", params=()) -> list[dict]:
+        return [_item(row) for row in self._rows(where, params)]
+
+    def _linked(self, column: str, key: str, object_id: str) -> list[str]:
+        rows = (
+            self._connection()
+            .execute(
+                f"SELECT {column} FROM links WHERE {key} = ?"
+                f" GROUP BY {column} ORDER BY MIN(rowid)",
+                (object_id,),
+            )
+            .fetchall()
+        )
+        return [row[0] for row in rows]
+
+    def _metadata(self, connection, object_id: str) -> dict:
+        row = connection.execute(
+            "SELECT metadata FROM objects WHERE id = ?", (object_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(object_id)
+        return codec.loads(row[0])
+
+    def _write_metadata(self, connection, object_id: str, metadata: dict):
+        port, origin_id = self._origin(metadata)
+        connection.execute(
+            "UPDATE objects SET metadata = ?, origin_port = ?, origin_id = ?"
+            " WHERE id = ?",
+            (codec.dumps(metadata).decode(), port, origin_id, object_id),
+        )
+        self._write_links(connection, {"id": object_id, "metadata": metadata})
+
+    def _write_links(self, connection, item: dict):
+        connection.execute("DELETE FROM links WHERE source = ?", (item["id"],))
+        connection.executemany(
+            "INSERT INTO links (source, parent, child) VALUES (?, ?, ?)",
+            self._links_of(item),
+        )
+
+    def _links_of(self, item: dict) -> list[tuple[str, str, str]]:
+        metadata = item["metadata"]
+        return [
+            (item["id"], parent, item["id"])
+            for parent in _ids(metadata.get(self.parent_key))
+        ] + [
+            (item["id"], item["id"], child)
+            for child in _ids(metadata.get(self.children_key))
+        ]
+
+    def _origin(self, metadata: dict) -> tuple[int | None, str | None]:
+        origin = metadata.get(self.provenance_key) if self.provenance_key else None
+        if isinstance(origin, dict) and "from" in origin and "with_id" in origin:
+            return int(origin["from"]), origin["with_id"]
+        return None, None
+
+    def _row(self, item: dict) -> tuple:
+        return (
+            item["id"],
+            item["type"],
+            item["type"].lower(),
+            item["title"],
+            item["ontology"],
+            item["ontology"].lower(),
+            codec.dumps(item["metadata"]).decode(),
+            *self._origin(item["metadata"]),
+        )
+
+
+def _item(row: tuple) -> dict:
+    _, object_id, object_type, title, metadata, ontology = row
+    return {
+        "id": object_id,
+        "type": object_type,
+        "title": title,
+        "metadata": codec.loads(metadata),
+        "ontology": ontology,
+    }
@@ -0,0 +1,470 @@
+import bisect
+import hashlib
+import json
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from copy import deepcopy
+from itertools import islice
+from threading import Condition, RLock
+
+
+class ChangeLog:
+    """Append-only log of store mutations numbered by a monotonic sequence.
+
+    Entries made while applying a peer's data record its port as `source`,
+    so that the peer is not sent its own changes back. Only the last
+    `maxlen` entries are retained. Readers asking for changes
+    older than that, from before a reset, or from a sequence this log never
+    reached (e.g. before a restart), are told to reload instead.
+    """
+
+    def __init__(self, maxlen=10000):
+        self.epoch = uuid.uuid4().hex
+        self.sequence = 0
+        self._entries: deque[dict] = deque(maxlen=maxlen)
+        self._condition = Condition()
+
+    def append(
+        self, op: str, object_id: str | None = None, source: int | None = None
+    ) -> int:
+        with self._condition:
+            self.sequence += 1
+            self._entries.append(
+                {"seq": self.sequence, "op": op, "id": object_id, "source": source}
+            )
+            self._condition.notify_all()
+            return self.sequence
+
+    def since(self, sequence: int) -> tuple[list[dict], bool]:
+        with self._condition:
+            if sequence == self.sequence:
+                return [], False
+            if (
+                sequence > self.sequence
+                or not self._entries
+                or self._entries[0]["seq"] > sequence + 1
+            ):
+                return [], True
+            # Sequences are contiguous, so the changes are the newest entries.
+            count = self.sequence - sequence
+            changes = list(islice(reversed(self._entries), count))[::-1]
+        if any(change["op"] == "reset" for change in changes):
+            return [], True
+        return changes, False
+
+    def wait(self, sequence: int, timeout=None) -> tuple[list[dict], bool]:
+        with self._condition:
+            self._condition.wait_for(lambda: self.sequence != sequence, timeout)
+        return self.since(sequence)
+
+
+def content_hash(metadata: dict) -> str:
+    """A stable digest of `metadata`, independent of key order."""
+    encoded = json.dumps(metadata, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(encoded.encode()).hexdigest()
+
+
+class ObjectStore:
+    """Platform objects indexed by id, type and ontology.
+
+    Id lookups are O(1), type and ontology filters are O(k) in the number of
+    matches. Type and ontology are matched case-insensitively. Every
+    mutation, including `load`, is recorded in `changes` and its sequence
+    number doubles as the store `version`. Objects imported from a peer are
+    also indexed by the (port, id) origin recorded under `provenance_key` in
+    their metadata, alongside the hash of the content last received from it.
+    Parent/child links declared under `parent_key` or `children_key` on
+    either end are kept in an adjacency index for lineage traversal.
+
+    Named snapshots capture the objects, indexes and state. Taking or
+    restoring one copies the indexes but shares the objects, which are only
+    copied when next mutated.
+    """
+
+    def __init__(
+        self,
+        items=(),
+        history=10000,
+        provenance_key=None,
+        parent_key=None,
+        children_key=None,
+    ):
+        self.provenance_key = provenance_key
+        self.parent_key = parent_key
+        self.children_key = children_key
+        self.changes = ChangeLog(maxlen=history)
+        self._state: dict[str, object] = {}
+        self._snapshots: dict[str, dict] = {}
+        self._write_lock = RLock()
+        self.load(items)
+
+    @property
+    def version(self):
+        return self.changes.sequence
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def load(self, items):
+        with self._write_lock:
+            self._items: dict[str, dict] = {}
+            self._order: list[str] = []
+            self._position: dict[str, int] = {}
+            self._by_type: dict[str, dict[str, dict]] = defaultdict(dict)
+            self._by_ontology: dict[str, dict[str, dict]] = defaultdict(dict)
+            self._type_positions: dict[str, list[int]] = defaultdict(list)
+            self._ontology_positions: dict[str, list[int]] = defaultdict(list)
+            self._by_origin: dict[tuple[int, str], str] = {}
+            self._received: dict[tuple[int, str], str] = {}
+            self._children: dict[str, Counter[str]] = defaultdict(Counter)
+            self._parents: dict[str, Counter[str]] = defaultdict(Counter)
+            self._links: dict[str, set[tuple[str, str]]] = {}
+            self._shared: set[str] = set()
+            for item in items:
+                self._index(item)
+            self._generation = self.changes.append("reset")
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+    def __contains__(self, object_id):
+        return object_id in self._items
+
+    def get(self, object_id) -> dict | None:
+        return self._items.get(object_id)
+
+    def filter_by_type(self, object_type: str) -> list[dict]:
+        return list(self._by_type.get(object_type.lower(), {}).values())
+
+    def filter_by_ontology(self, ontology: str) -> list[dict]:
+        return list(self._by_ontology.get(ontology.lower(), {}).values())
+
+    def filter(self, object_type=None, ontology=None) -> list[dict]:
+        if object_type:
+            items = self.filter_by_type(object_type)
+        elif ontology:
+            items = self.filter_by_ontology(ontology)
+        else:
+            items = list(self)
+        return [item for item in items if self.matches(item, object_type, ontology)]
+
+    def page(
+        self, cursor=None, limit=None, object_type=None, ontology=None
+    ) -> tuple[list[dict], str | None]:
+        """Up to `limit` matching objects in insertion order, after `cursor`.
+
+        Returns the page and the cursor of the next one, or None on the last
+        page. Cursors stay valid across inserts and updates but not across
+        `load`; a stale or malformed cursor raises ValueError.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError("Limit must be positive.")
+        start = self._decode_cursor(cursor) if cursor else 0
+        if object_type or ontology:
+            index = self._type_positions if object_type else self._ontology_positions
+            positions = index.get((object_type or ontology).lower(), [])
+            matching = (
+                item
+                for i in range(bisect.bisect_left(positions, start), len(positions))
+                if self.matches(
+                    item := self._items[self._order[positions[i]]],
+                    object_type,
+                    ontology,
+                )
+            )
+            items = list(islice(matching, None if limit is None else limit + 1))
+        else:
+            end = None if limit is None else start + limit + 1
+            items = [self._items[object_id] for object_id in self._order[start:end]]
+        if limit is None or len(items) <= limit:
+            return items, None
+        items = items[:limit]
+        return items, f"{self._generation}.{self._position[items[-1]['id']] + 1}"
+
+    def scan(self, cursor=None, object_type=None, ontology=None):
+        """An iterator over every matching object after `cursor`, like `page`.
+
+        The cursor is checked at once, the objects may be read lazily.
+        """
+        return iter(self.page(cursor, None, object_type, ontology)[0])
+
+    def _decode_cursor(self, cursor: str) -> int:
+        generation, _, position = cursor.partition(".")
+        if not (generation.isdigit() and position.isdigit()):
+            raise ValueError("Malformed cursor.")
+        if int(generation) != self._generation:
+            raise ValueError("Cursor expired, the data was reset.")
+        return int(position)
+
+    @staticmethod
+    def matches(item: dict, object_type=None, ontology=None) -> bool:
+        return (not object_type or item["type"].lower() == object_type.lower()) and (
+            not ontology or item["ontology"].lower() == ontology.lower()
+        )
+
+    def find_imported(self, port: int, origin_id: str) -> dict | None:
+        if (object_id := self._by_origin.get((int(port), origin_id))) is None:
+            return None
+        return self._items.get(object_id)
+
+    def received_hash(self, port: int, origin_id: str) -> str | None:
+        return self._received.get((int(port), origin_id))
+
+    def mark_received(self, port: int, origin_id: str, digest: str):
+        with self._write_lock:
+            self._received[(int(port), origin_id)] = digest
+
+    def children(self, object_id: str) -> list[str]:
+        return list(self._children.get(object_id, ()))
+
+    def parents(self, object_id: str) -> list[str]:
+        return list(self._parents.get(object_id, ()))
+
+    def lineage(
+        self, object_id: str, direction="descendants", depth=None
+    ) -> tuple[list[tuple[str, int]], list[tuple[str, str]]]:
+        """Breadth-first walk from `object_id` over at most `depth` links.
+
+        Returns the reached (id, depth) pairs, starting with `object_id`, and
+        the traversed (parent, child) links. Each object is visited once, so
+        cycles terminate.
+        """
+        if direction not in ("descendants", "ancestors"):
+            raise ValueError(f"Unknown lineage direction {direction!r}.")
+        neighbours = self.children if direction == "descendants" else self.parents
+        reached = {object_id: 0}
+        queue = deque([object_id])
+        links = []
+        while queue:
+            current = queue.popleft()
+            if depth is not None and reached[current] >= depth:
+                continue
+            for neighbour in neighbours(current):
+                if neighbour not in self:
+                    continue
+                links.append(
+                    (current, neighbour)
+                    if direction == "descendants"
+                    else (neighbour, current)
+                )
+                if neighbour not in reached:
+                    reached[neighbour] = reached[current] + 1
+                    queue.append(neighbour)
+        return list(reached.items()), links
+
+    def batch(self):
+        """Hold the store's write lock over several mutations.
+
+        Checks and writes made inside one batch are atomic with respect to
+        other threads. Batches nest.
+        """
+        return self._write_lock
+
+    def on_rollback(self, callback):
+        """Call `callback` if the enclosing batch is rolled back.
+
+        The in-memory store never rolls back, so it is never called.
+        """
+
+    def snapshots(self) -> list[dict]:
+        return [
+            {
+                "name": name,
+                "created": snapshot["created"],
+                "objects": snapshot["objects"],
+            }
+            for name, snapshot in self._snapshots.items()
+        ]
+
+    def snapshot(self, name: str):
+        """Save the objects, indexes and state under `name`.
+
+        Snapshots are immutable; taking an existing one raises KeyError.
+        """
+        with self._write_lock:
+            if name in self._snapshots:
+                raise KeyError(f"Snapshot {name} already exists.")
+            self._snapshots[name] = {
+                "created": time.time(),
+                "objects": len(self._items),
+                "indexes": self._copy_indexes(),
+                "state": deepcopy(self._state),
+            }
+            self._shared = set(self._items)
+
+    def restore(self, name: str):
+        """Replace the objects, indexes and state with snapshot `name`."""
+        with self._write_lock:
+            if (snapshot := self._snapshots.get(name)) is None:
+                raise KeyError(f"Snapshot {name} not found.")
+            self._set_indexes(snapshot["indexes"])
+            self._state = deepcopy(snapshot["state"])
+            self._shared = set(self._items)
+            self._generation = self.changes.append("reset")
+
+    def drop_snapshot(self, name: str):
+        with self._write_lock:
+            if self._snapshots.pop(name, None) is None:
+                raise KeyError(f"Snapshot {name} not found.")
+
+    def get_state(self, key: str, default=None):
+        return self._state.get(key, default)
+
+    def set_state(self, key: str, value):
+        with self._write_lock:
+            self._state[key] = value
+
+    def delete_state(self, key: str):
+        with self._write_lock:
+            self._state.pop(key, None)
+
+    def add(self, item: dict, source: int | None = None):
+        with self._write_lock:
+            if item["id"] in self._items:
+                raise KeyError(f"Object {item['id']} already exists.")
+            self._index(item)
+            self.changes.append("add", item["id"], source)
+        return item
+
+    def update_metadata(
+        self, object_id: str, metadata: dict, source: int | None = None
+    ) -> bool:
+        with self._write_lock:
+            current = self._items[object_id]["metadata"]
+            if all(
+                key in current and current[key] == value
+                for key, value in metadata.items()
+            ):
+                return False
+            item = self._own(object_id)
+            item["metadata"].update(metadata)
+            self._index_origin(item)
+            self._index_links(item)
+            self.changes.append("update", object_id, source)
+        return True
+
+    def add_child(self, parent_id: str, child_id: str):
+        with self._write_lock:
+            item = self._items[parent_id]
+            if (parent_id, child_id) not in self._links.get(parent_id, ()):
+                # Link sets, like objects, are shared with snapshots until the
+                # object is owned.
+                if parent_id in self._shared:
+                    self._links[parent_id] = set(self._links.get(parent_id, ()))
+                item = self._own(parent_id)
+                item["metadata"].setdefault(self.children_key, []).append(child_id)
+                self._links.setdefault(parent_id, set()).add((parent_id, child_id))
+                self._link(parent_id, child_id, 1)
+                self.changes.append("update", parent_id)
+        return item
+
+    def _own(self, object_id: str) -> dict:
+        item = self._items[object_id]
+        if object_id in self._shared:
+            item = deepcopy(item)
+            self._items[object_id] = item
+            self._by_type[item["type"].lower()][object_id] = item
+            self._by_ontology[item["ontology"].lower()][object_id] = item
+            self._shared.discard(object_id)
+        return item
+
+    def _copy_indexes(self) -> dict:
+        return {
+            "_items": self._items.copy(),
+            "_order": self._order.copy(),
+            "_position": self._position.copy(),
+            "_by_type": _copy_nested(self._by_type, dict),
+            "_by_ontology": _copy_nested(self._by_ontology, dict),
+            "_type_positions": _copy_nested(self._type_positions, list),
+            "_ontology_positions": _copy_nested(self._ontology_positions, list),
+            "_by_origin": self._by_origin.copy(),
+            "_received": self._received.copy(),
+            "_children": _copy_nested(self._children, Counter),
+            "_parents": _copy_nested(self._parents, Counter),
+            "_links": self._links.copy(),
+        }
+
+    def _set_indexes(self, indexes: dict):
+        self._items = indexes["_items"].copy()
+        self._order = indexes["_order"].copy()
+        self._position = indexes["_position"].copy()
+        self._by_type = _copy_nested(indexes["_by_type"], dict)
+        self._by_ontology = _copy_nested(indexes["_by_ontology"], dict)
+        self._type_positions = _copy_nested(indexes["_type_positions"], list)
+        self._ontology_positions = _copy_nested(indexes["_ontology_positions"], list)
+        self._by_origin = indexes["_by_origin"].copy()
+        self._received = indexes["_received"].copy()
+        self._children = _copy_nested(indexes["_children"], Counter)
+        self._parents = _copy_nested(indexes["_parents"], Counter)
+        self._links = indexes["_links"].copy()
+
+    def _index(self, item: dict):
+        if item["id"] not in self._position:
+            position = self._position[item["id"]] = len(self._order)
+            self._order.append(item["id"])
+            self._type_positions[item["type"].lower()].append(position)
+            self._ontology_positions[item["ontology"].lower()].append(position)
+        self._items[item["id"]] = item
+        self._by_type[item["type"].lower()][item["id"]] = item
+        self._by_ontology[item["ontology"].lower()][item["id"]] = item
+        self._index_origin(item)
+        self._index_links(item)
+
+    def _index_origin(self, item: dict):
+        if not self.provenance_key:
+            return
+        origin = item["metadata"].get(self.provenance_key)
+        if isinstance(origin, dict) and "from" in origin and "with_id" in origin:
+            self._by_origin[(int(origin["from"]), origin["with_id"])] = item["id"]
+
+    def _index_links(self, item: dict):
+        for parent, child in self._links.pop(item["id"], ()):
+            self._link(parent, child, -1)
+        metadata = item["metadata"]
+        links = {
+            (parent, item["id"]) for parent in _ids(metadata.get(self.parent_key))
+        } | {(item["id"], child) for child in _ids(metadata.get(self.children_key))}
+        for parent, child in links:
+            self._link(parent, child, 1)
+        self._links[item["id"]] = links
+
+    def _link(self, parent: str, child: str, count: int):
+        for adjacency, source, target in (
+            (self._children, parent, child),
+            (self._parents, child, parent),
+        ):
+            adjacency[source][target] += count
+            if adjacency[source][target] <= 0:
+                del adjacency[source][target]
+                if not adjacency[source]:
+                    del adjacency[source]
+
+
+def _copy_nested(index: dict, factory) -> defaultdict:
+    copy = defaultdict(factory)
+    copy.update((key, factory(value)) for key, value in index.items())
+    return copy
+
+
+def _ids(value) -> list[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [entry for entry in value if isinstance(entry, str)]
+    return []
+
+
+def open_store(backend="memory", path=None, items=(), **options) -> ObjectStore:
+    """Open the object store of the given backend, "memory" or "sqlite"."""
+    if backend == "sqlite":
+        from shared.sqlite_store import SQLiteObjectStore
+
+        return SQLiteObjectStore(path, items, **options)
+    if backend != "memory":
+        raise ValueError(f"Unknown storage backend {backend!r}.")
+    return ObjectStore(items, **options)
@@ -0,0 +1,161 @@
+import hashlib
+import json
+from collections import OrderedDict
+from threading import Lock
+
+from shared.loader import jsonld
+
+SCALARS = (str, int, float, bool)
+
+
+class TranslationPlan:
+    """A compiled rename of metadata keys from a source to a target context.
+
+    Only term definitions whose expansion and compaction round trip to a
+    plain key rename are compiled. `apply` returns `None` for any value the
+    plan cannot express, in which case the caller falls back to pyld.
+    """
+
+    def __init__(self, source, target):
+        self.rules: dict[str, tuple[str, str, str | None]] = {}
+        self.unsupported: set[str] = set()
+        self.compiled = isinstance(source, dict) and isinstance(target, dict)
+        if not self.compiled or any(key.startswith("@") for key in source):
+            self.compiled = False
+            return
+        targets: dict[str, list] = {}
+        for key, definition in target.items():
+            if (term := _term(definition)) is not None:
+                targets.setdefault(term[0], []).append((key, term))
+        sources: dict[str, list] = {}
+        for key, definition in source.items():
+            if (term := _term(definition)) is None:
+                self.unsupported.add(key)
+            else:
+                sources.setdefault(term[0], []).append((key, term))
+        for iri, terms in sources.items():
+            matches = targets.get(iri, [])
+            if len(terms) != 1 or len(matches) != 1 or matches[0][1] != terms[0][1]:
+                self.unsupported.update(key for key, _ in terms)
+                continue
+            key, (_, container, _) = terms[0]
+            self.rules[key] = (matches[0][0], iri, container)
+
+    def apply(self, metadata: dict) -> dict | None:
+        if not self.compiled:
+            return None
+        translated = []
+        for key, value in metadata.items():
+            if value is None:
+                continue
+            if key.startswith("@") or ":" in key or key in self.unsupported:
+                return None
+            if key not in self.rules:
+                continue
+            target_key, iri, container = self.rules[key]
+            if (value := _compact(value, container)) is None:
+                return None
+            translated.append((iri, target_key, value))
+        return {key: value for _, key, value in sorted(translated)}
+
+
+def _term(definition):
+    if isinstance(definition, str):
+        definition = {"@id": definition}
+    if not isinstance(definition, dict) or not isinstance(
+        iri := definition.get("@id"), str
+    ):
+        return None
+    if set(definition) - {"@id", "@type", "@container"}:
+        return None
+    container = definition.get("@container")
+    if container not in (None, "@set", "@index"):
+        return None
+    if (value_type := definition.get("@type")) in ("@id", "@vocab"):
+        return None
+    return iri, container, value_type
+
+
+def _compact(value, container):
+    if container == "@index":
+        if not isinstance(value, dict) or not value:
+            return None
+        indexed = {}
+        for index, entry in value.items():
+            if entry is None:
+                continue
+            if isinstance(entry, list):
+                if len(entry) < 2 or not all(isinstance(v, SCALARS) for v in entry):
+                    return None
+                indexed[index] = list(entry)
+            elif isinstance(entry, SCALARS):
+                indexed[index] = entry
+            else:
+                return None
+        return indexed or None
+    if isinstance(value, SCALARS):
+        return [value] if container == "@set" else value
+    if not isinstance(value, list) or not all(isinstance(v, SCALARS) for v in value):
+        return None
+    if container == "@set":
+        return list(value)
+    if not value:
+        return None
+    return value[0] if len(value) == 1 else list(value)
+
+
+class PlanCache:
+    """Translation plans keyed by a fingerprint of (source, target) contexts."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self._plans: OrderedDict[str, TranslationPlan] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, source, target) -> TranslationPlan:
+        key = fingerprint(source, target)
+        with self._lock:
+            if (plan := self._plans.get(key)) is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+        plan = TranslationPlan(source, target)
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+        return plan
+
+    def stats(self):
+        return {
+            "plans": len(self._plans),
+            "hits": self.hits,
+            "misses": self.misses,
+            "fallbacks": self.fallbacks,
+        }
+
+
+PLANS = PlanCache()
+
+
+def fingerprint(source, target):
+    content = json.dumps([source, target], sort_keys=True, default=str)
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def translate(source, metadata: dict, target) -> dict:
+    if (translated := PLANS.get(source, target).apply(metadata)) is not None:
+        return translated
+    PLANS.fallbacks += 1
+    return expand_and_compact(source, metadata, target)
+
+
+def expand_and_compact(source, metadata: dict, target) -> dict:
+    expanded = jsonld().expand({"@context": source, **metadata})
+    metadata = jsonld().compact(expanded, target)
+    metadata.pop("@context")
+    return metadata
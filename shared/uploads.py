@@ -0,0 +1,34 @@
+import hashlib
+from tempfile import SpooledTemporaryFile
+
+from flask import Request, current_app
+
+
+class HashingSpooledFile(SpooledTemporaryFile):
+    """A spooled temporary file that hashes everything written to it.
+
+    Content stays in memory up to `max_size` bytes and rolls over to disk
+    beyond that, so memory use is bounded regardless of the upload size.
+    """
+
+    def __init__(self, max_size=1024 * 1024, algorithm="sha256"):
+        super().__init__(max_size=max_size)
+        self.digest = hashlib.new(algorithm)
+        self.size = 0
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        return super().write(data)
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+class SpooledRequest(Request):
+    """Request whose uploaded files are parsed into `HashingSpooledFile`s."""
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        return HashingSpooledFile(max_size=current_app.config["SPOOL_MEMORY_LIMIT"])
@@ -0,0 +1,16 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def load_platform_data(platform: str):
+    """The `data` module of a platform, loaded under a platform-specific name."""
+    spec = importlib.util.spec_from_file_location(
+        f"{platform}_data", ROOT / platform / "data" / "__init__.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from shared.ids import IdAllocator
+from shared.store import open_store
+
+IDS = {"Sample": {"prefix": "SAMPLE", "counter": 2}}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    return open_store(request.param, tmp_path / "data.sqlite3")
+
+
+def test_ids_continue_from_the_counters(store):
+    allocator = IdAllocator(store, dict(IDS), block_size=4)
+    assert allocator.allocate("Sample", 2) == ["SAMPLE-3", "SAMPLE-4"]
+    assert allocator.next_id("Sample") == "SAMPLE-5"
+    assert store.get_state("ids")["Sample"]["counter"] == 6
+
+
+def test_threads_get_distinct_ids(store):
+    allocator = IdAllocator(store, dict(IDS), block_size=3)
+    with ThreadPoolExecutor(8) as executor:
+        ids = list(executor.map(lambda _: allocator.next_id("Sample"), range(200)))
+    assert len(set(ids)) == 200
+
+
+def test_allocators_sharing_a_store_get_distinct_ids(tmp_path):
+    path = tmp_path / "data.sqlite3"
+    first = IdAllocator(open_store("sqlite", path), dict(IDS), block_size=4)
+    second = IdAllocator(open_store("sqlite", path), dict(IDS), block_size=4)
+    ids = [allocator.next_id("Sample") for allocator in (first, second) * 6]
+    assert len(set(ids)) == 12
+
+
+def test_reset_restarts_the_counters(store):
+    allocator = IdAllocator(store, dict(IDS), block_size=4)
+    allocator.next_id("Sample")
+    allocator.reset(IDS)
+    assert allocator.next_id("Sample") == "SAMPLE-3"
+
+
+def test_blocks_are_dropped_when_the_store_is_reset(store):
+    allocator = IdAllocator(store, dict(IDS), block_size=4)
+    allocator.next_id("Sample")
+    store.load([])
+    store.set_state("ids", IDS)
+    assert allocator.next_id("Sample") == "SAMPLE-3"
+
+
+def test_rolled_back_blocks_are_dropped(tmp_path):
+    store = open_store("sqlite", tmp_path / "data.sqlite3")
+    allocator = IdAllocator(store, dict(IDS), block_size=4)
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            assert allocator.next_id("Sample") == "SAMPLE-3"
+            raise RuntimeError
+    assert store.get_state("ids")["Sample"]["counter"] == 2
+    assert allocator.next_id("Sample") == "SAMPLE-3"
+    assert allocator.next_id("Sample") == "SAMPLE-4"
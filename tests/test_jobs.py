@@ -0,0 +1,49 @@
+import time
+
+from shared.jobs import JobFailed, JobQueue
+from shared.store import open_store
+
+
+def wait(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while (job := queue.get(job_id))["finished_at"] is None:
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.01)
+    return job
+
+
+def fail():
+    raise JobFailed("Peer refused", {"status": 500})
+
+
+def test_job_results_and_failures():
+    queue = JobQueue(workers=1)
+    job = wait(queue, queue.submit("add", lambda a, b: a + b, 1, 2)["id"])
+    assert (job["state"], job["result"]) == ("succeeded", 3)
+    job = wait(queue, queue.submit("fail", fail)["id"])
+    assert (job["state"], job["error"], job["result"]) == (
+        "failed",
+        "Peer refused",
+        {"status": 500},
+    )
+    assert queue.get("missing") is None
+
+
+def test_queues_sharing_a_store_report_each_others_jobs(tmp_path):
+    path = tmp_path / "data.sqlite3"
+    queue = JobQueue(workers=1, store=open_store("sqlite", path))
+    other = JobQueue(workers=1, store=open_store("sqlite", path))
+    job_id = queue.submit("add", lambda: 3)["id"]
+    wait(queue, job_id)
+    assert other.get(job_id)["state"] == "succeeded"
+    assert other.get(job_id)["result"] == 3
+
+
+def test_stored_jobs_are_pruned(tmp_path):
+    store = open_store("sqlite", tmp_path / "data.sqlite3")
+    queue = JobQueue(workers=1, history=2, store=store)
+    job_ids = [queue.submit("noop", lambda: None)["id"] for _ in range(3)]
+    for job_id in job_ids[1:]:
+        wait(queue, job_id)
+    assert store.get_state("jobs") == job_ids[1:]
+    assert store.get_state(f"jobs:{job_ids[0]}") is None
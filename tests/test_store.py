@@ -0,0 +1,215 @@
+from copy import deepcopy
+
+import pytest
+
+from shared.store import open_store
+
+OPTIONS = {
+    "provenance_key": "was_imported",
+    "parent_key": "has_parent",
+    "children_key": "has_children",
+}
+
+
+def make_item(
+    object_id, object_type="Sample", ontology="https://example.org/Sample", **metadata
+):
+    return {
+        "id": object_id,
+        "type": object_type,
+        "title": f"Title of {object_id}",
+        "metadata": metadata,
+        "ontology": ontology,
+    }
+
+
+ITEMS = [
+    make_item(
+        "WF-1", "Workflow", "https://example.org/Workflow", has_children=["SIM-1"]
+    ),
+    make_item(
+        "SIM-1", "Simulation", "https://example.org/Simulation", has_parent="WF-1"
+    ),
+    make_item("SAMPLE-1", size=1),
+]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    path = tmp_path / "data.sqlite3"
+    return open_store(request.param, path, deepcopy(ITEMS), **OPTIONS)
+
+
+def ids(items):
+    return [item["id"] for item in items]
+
+
+def test_lookups(store):
+    assert len(store) == 3
+    assert "SIM-1" in store and "SIM-2" not in store
+    assert store.get("SAMPLE-1")["metadata"] == {"size": 1}
+    assert ids(store.filter_by_type("simulation")) == ["SIM-1"]
+    assert ids(store.filter_by_ontology("https://example.org/sample")) == ["SAMPLE-1"]
+    assert store.lineage("SIM-1", "ancestors") == (
+        [("SIM-1", 0), ("WF-1", 1)],
+        [("WF-1", "SIM-1")],
+    )
+
+
+def test_add_rejects_duplicates(store):
+    with pytest.raises(KeyError):
+        store.add(make_item("SAMPLE-1"))
+
+
+def test_update_metadata_merges_keys(store):
+    assert store.update_metadata("SAMPLE-1", {"color": "red"})
+    assert not store.update_metadata("SAMPLE-1", {"size": 1})
+    assert store.get("SAMPLE-1")["metadata"] == {"size": 1, "color": "red"}
+
+
+def test_add_child_links_once(store):
+    store.add(make_item("SIM-2", "Simulation", "https://example.org/Simulation"))
+    version = store.version
+    store.add_child("WF-1", "SIM-2")
+    store.add_child("WF-1", "SIM-2")
+    assert store.get("WF-1")["metadata"]["has_children"] == ["SIM-1", "SIM-2"]
+    assert store.version == version + 1
+    assert store.parents("SIM-2") == ["WF-1"]
+
+
+def test_imported_objects(store):
+    store.add(make_item("SAMPLE-2", was_imported={"from": 5001, "with_id": "S-9"}))
+    store.mark_received(5001, "S-9", "digest")
+    assert store.find_imported(5001, "S-9")["id"] == "SAMPLE-2"
+    assert store.find_imported(5002, "S-9") is None
+    assert store.received_hash(5001, "S-9") == "digest"
+
+
+def test_pages_follow_insertion_order(store):
+    store.add(make_item("SAMPLE-2"))
+    page, cursor = store.page(limit=2)
+    assert ids(page) == ["WF-1", "SIM-1"]
+    page, cursor = store.page(cursor, limit=2)
+    assert ids(page) == ["SAMPLE-1", "SAMPLE-2"] and cursor is None
+    page, cursor = store.page(limit=1, object_type="sample")
+    assert ids(page) == ["SAMPLE-1"]
+    assert ids(store.page(cursor, limit=1, object_type="sample")[0]) == ["SAMPLE-2"]
+    assert ids(store.scan(cursor, ontology="https://example.org/Sample")) == [
+        "SAMPLE-2"
+    ]
+
+
+def test_stale_cursors_are_rejected(store):
+    _, cursor = store.page(limit=1)
+    store.load(deepcopy(ITEMS))
+    with pytest.raises(ValueError):
+        store.page(cursor, limit=1)
+    with pytest.raises(ValueError):
+        store.scan("not-a-cursor")
+
+
+def test_change_log(store):
+    since = store.version
+    store.add(make_item("SAMPLE-2"), source=5001)
+    store.update_metadata("SAMPLE-1", {"size": 2})
+    changes, reset = store.changes.since(since)
+    assert not reset
+    assert [(change["op"], change["id"], change["source"]) for change in changes] == [
+        ("add", "SAMPLE-2", 5001),
+        ("update", "SAMPLE-1", None),
+    ]
+    assert store.changes.since(store.version) == ([], False)
+
+
+def test_change_log_resets_readers_it_cannot_serve(store):
+    since = store.version
+    store.load(deepcopy(ITEMS))
+    assert store.changes.since(since) == ([], True)
+    assert store.changes.since(store.version + 5) == ([], True)
+    assert store.changes.wait(store.version + 5, timeout=0) == ([], True)
+
+
+def test_state(store):
+    assert store.get_state("missing", {}) == {}
+    store.set_state("mapping", {"a": 1})
+    assert store.get_state("mapping") == {"a": 1}
+
+
+def test_sqlite_store_is_durable(tmp_path):
+    path = tmp_path / "data.sqlite3"
+    store = open_store("sqlite", path, deepcopy(ITEMS), **OPTIONS)
+    store.add(make_item("SAMPLE-2"))
+    store.set_state("mapping", {"a": 1})
+    epoch, version = store.changes.epoch, store.version
+
+    reopened = open_store("sqlite", path, [], **OPTIONS)
+    assert ids(reopened) == ["WF-1", "SIM-1", "SAMPLE-1", "SAMPLE-2"]
+    assert reopened.get_state("mapping") == {"a": 1}
+    assert (reopened.changes.epoch, reopened.version) == (epoch, version)
+
+
+def test_sqlite_batch_rolls_back(tmp_path):
+    store = open_store("sqlite", tmp_path / "data.sqlite3", deepcopy(ITEMS), **OPTIONS)
+    rolled_back = []
+    version = store.version
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            store.add(make_item("SAMPLE-2"))
+            store.set_state("mapping", {"a": 1})
+            store.on_rollback(lambda: rolled_back.append(True))
+            raise RuntimeError
+    assert "SAMPLE-2" not in store
+    assert store.get_state("mapping") is None
+    assert store.version == version
+    assert rolled_back == [True]
+
+
+def test_snapshots_restore_objects_and_state(store):
+    store.set_state("mapping", {"a": 1})
+    store.snapshot("before")
+    store.add(make_item("SAMPLE-2"))
+    store.update_metadata("SAMPLE-1", {"size": 2})
+    store.add_child("WF-1", "SAMPLE-1")
+    store.set_state("mapping", {"a": 2})
+    generation = store.generation
+
+    store.restore("before")
+    assert ids(store) == ["WF-1", "SIM-1", "SAMPLE-1"]
+    assert store.get("SAMPLE-1")["metadata"] == {"size": 1}
+    assert store.children("WF-1") == ["SIM-1"]
+    assert store.get_state("mapping") == {"a": 1}
+    assert store.generation != generation
+    assert store.changes.since(generation - 1) == ([], True)
+
+
+def test_snapshots_are_immutable(store):
+    store.snapshot("before")
+    store.update_metadata("SAMPLE-1", {"size": 2})
+    store.restore("before")
+    store.update_metadata("SAMPLE-1", {"size": 3})
+    store.add_child("WF-1", "SAMPLE-1")
+    store.restore("before")
+    assert store.get("SAMPLE-1")["metadata"] == {"size": 1}
+    assert store.children("WF-1") == ["SIM-1"]
+    with pytest.raises(KeyError):
+        store.snapshot("before")
+
+
+def test_unknown_snapshots(store):
+    with pytest.raises(KeyError):
+        store.restore("missing")
+    with pytest.raises(KeyError):
+        store.drop_snapshot("missing")
+    store.snapshot("before")
+    assert [snapshot["name"] for snapshot in store.snapshots()] == ["before"]
+    store.drop_snapshot("before")
+    assert store.snapshots() == []
+
+
+def test_sqlite_snapshots_are_durable(tmp_path):
+    path = tmp_path / "data.sqlite3"
+    open_store("sqlite", path, deepcopy(ITEMS), **OPTIONS).snapshot("before")
+    store = open_store("sqlite", path, [], **OPTIONS)
+    store.add(make_item("SAMPLE-2"))
+    store.restore("before")
+    assert ids(store) == ["WF-1", "SIM-1", "SAMPLE-1"]
@@ -0,0 +1,125 @@
+import importlib
+import random
+import sys
+
+import pytest
+from conftest import ROOT, load_platform_data
+
+from shared.translation import TranslationPlan, expand_and_compact
+
+CONTEXTS = [
+    (f"{platform}:{ontology}", context["@context"])
+    for platform in ("aiida", "openbis")
+    for ontology, context in load_platform_data(platform).CONTEXT.items()
+]
+SYNTHETIC = {
+    "name": "https://schema.org/name",
+    "tags": {"@id": "https://schema.org/keywords", "@container": "@set"},
+    "labels": {"@id": "https://schema.org/alternateName", "@container": "@index"},
+    "size": {"@id": "https://schema.org/size", "@type": "xsd:integer"},
+}
+PAIRS = [
+    pytest.param(source, target, id=f"{source_name}->{target_name}")
+    for source_name, source in [*CONTEXTS, ("synthetic", SYNTHETIC)]
+    for target_name, target in [*CONTEXTS, ("synthetic", SYNTHETIC)]
+]
+
+
+def random_scalar(rng):
+    return rng.choice(
+        [
+            rng.choice(["", "a", "value", "x y"]),
+            rng.randint(-3, 100),
+            rng.choice([0.5, 2.25]),
+            rng.choice([True, False]),
+        ]
+    )
+
+
+def random_value(rng, depth=0):
+    kind = rng.randrange(7 if depth == 0 else 4)
+    if kind == 0:
+        return None
+    if kind in (1, 2):
+        return random_scalar(rng)
+    if kind == 3:
+        return [random_scalar(rng) for _ in range(rng.randrange(4))]
+    if kind == 4:
+        return {
+            rng.choice(["en", "de", "fr"]): random_value(rng, depth + 1)
+            for _ in range(rng.randrange(3))
+        }
+    if kind == 5:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(3))]
+    return {"nested": random_scalar(rng)}
+
+
+def random_metadata(rng, context):
+    keys = list(context) + ["unknown"]
+    return {
+        key: random_value(rng)
+        for key in rng.sample(keys, rng.randint(1, min(len(keys), 5)))
+    }
+
+
+@pytest.mark.parametrize("source, target", PAIRS)
+def test_plan_matches_pyld(source, target):
+    rng = random.Random(f"{sorted(source)}{sorted(target)}")
+    plan = TranslationPlan(source, target)
+    for _ in range(100):
+        metadata = random_metadata(rng, source)
+        if (translated := plan.apply(metadata)) is not None:
+            assert translated == expand_and_compact(source, metadata, target), metadata
+
+
+def test_platform_contexts_compile():
+    aiida = dict(CONTEXTS)["aiida:https://schema.org/Protein"]
+    openbis = dict(CONTEXTS)["openbis:https://schema.org/Protein"]
+    plan = TranslationPlan(aiida, openbis)
+    metadata = {
+        "has_parent": "SIM-1",
+        "has_children": ["A", "B"],
+        "hasBioPolymerSequence": "MK",
+    }
+    assert plan.apply(metadata) == expand_and_compact(aiida, metadata, openbis)
+    assert plan.apply(metadata) == {
+        "hasBioPolymerSequence": "MK",
+        "hasChildren": ["A", "B"],
+        "hasParent": "SIM-1",
+    }
+
+
+@pytest.fixture(scope="module")
+def aiida(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("aiida")
+    sys.path.insert(0, str(ROOT / "aiida"))
+    try:
+        module = importlib.import_module("app")
+    finally:
+        sys.path.remove(str(ROOT / "aiida"))
+    module.create_app(
+        {
+            "WARM_UP": False,
+            "UPLOAD_FOLDER": str(folder / "uploads"),
+            "RO_CRATE_FOLDER": str(folder / "crates"),
+            "CONTEXT_CACHE_FOLDER": str(folder / "contexts"),
+        }
+    )
+    return module
+
+
+def test_import_resolves_a_context_reference(aiida):
+    response = aiida.app.test_client().post(
+        "/data/import?port=5001",
+        json={
+            "@context": "https://schema.org/MolecularEntity",
+            "id": "SAMPLE-9",
+            "title": "Imported by reference",
+            "ontology": "https://schema.org/MolecularEntity",
+            "metadata": {"label": "Water", "formula": "H2O"},
+        },
+    )
+    assert response.status_code == 201, response.json
+    item = aiida.STORE.get(response.json["local_id"])
+    assert item["metadata"]["label"] == "Water"
+    assert item["metadata"]["formula"] == "H2O"